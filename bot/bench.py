@@ -0,0 +1,1190 @@
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from collections import Counter
+from contextvars import Context
+from datetime import datetime
+from pathlib import Path
+from statistics import quantiles
+from time import perf_counter, process_time, time
+
+import psutil
+from smokerbot import SmokerBotHandler, const, context, helpers, tracing
+from smokerbot.basehandler import BaseHandler
+from smokerbot.clock import VirtualClock
+from smokerbot.eventloop import new_event_loop
+from smokerbot.fakeclient import (
+    FAULT_BLOCKED,
+    FAULT_DISCONNECT,
+    FAULT_FLOOD_WAIT,
+    FAULT_FLOOD_WAIT_MAX,
+    FAULT_NOT_MODIFIED,
+    FakeTelegramClient,
+)
+from smokerbot.recorder import RECORD_KIND_MESSAGE, read_recording
+from telethon import events
+
+# Сценарий пользователя в генераторе нагрузки: (тип события, данные)
+LOAD_SCRIPT = (
+    ('message', '/run'),
+    ('message', '/smoke'),
+    ('message', '/status'),
+    ('callback', 'status_update'),
+    ('message', '/setinterval'),
+    ('callback', 'setinterval adjust 45'),
+    ('callback', 'setinterval set 45'),
+    ('callback', 'setmode set manual'),
+    ('message', '/stop'),
+)
+
+# Каталог результатов бенчмарков
+BENCH_RESULTS_PATH = Path('logs') / 'bench'
+
+# Кол-во повторов замера микробенчмарка (берется лучший)
+HOTPATH_REPEAT = 5
+
+# Изменение времени относительно предыдущего результата, считающееся
+# регрессией / улучшением
+HOTPATH_CHANGE_THRESHOLD = 0.1
+
+# Интервалы таймеров пользователей в симуляции, мин
+TIMER_INTERVALS = (15, 30, 45, 60, 90, 120)
+
+# Soak-тест: случайные действия пользователей (тип события, данные),
+# шаг виртуального времени, сек, таймаут передачи события (backpressure),
+# сек реального времени, и задачи, работающие постоянно (имена корутин)
+SOAK_ACTIONS = (
+    ('message', '/smoke'),
+    ('message', '/smoke'),
+    ('message', '/status'),
+    ('callback', 'status_update'),
+    ('message', '/stats'),
+    ('message', '/stop'),
+    ('message', '/run'),
+    ('message', '/start'),
+)
+SOAK_STEP = 60
+SOAK_DISPATCH_TIMEOUT = 5
+SOAK_BACKGROUND_TASKS = (
+    '_persitstence_task', '_retention_task', '_broadcast_task',
+    '_outbox_task', 'monitor_loop_lag',
+)
+
+# Время импорта: модуль (как при запуске runner.py), бюджет, мс (лучший из
+# `IMPORT_TIME_REPEAT` запусков) и зависимости, импортируемые лениво
+IMPORT_TIME_MODULE = 'runner'
+IMPORT_TIME_BUDGET_MS = 500
+IMPORT_TIME_REPEAT = 5
+IMPORT_TIME_LAZY_MODULES = ('numpy', 'psutil', 'yaml')
+
+# Первый user_id синтетических пользователей, id администратора - 1
+LOAD_FIRST_USER_ID = 1000
+ADMIN_USER_ID = 1
+
+
+def get_peak_rss_mb() -> float:
+    """Пиковый RSS процесса, МБ."""
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # NB: Linux - в КБ, macOS - в байтах
+    return maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+
+
+def get_percentiles(values: list[float]) -> tuple[float, float]:
+    """Получить 50-й и 99-й перцентили значений."""
+
+    if len(values) < 2:
+        return (values[0], values[0]) if values else (0., 0.)
+
+    percentiles = quantiles(values, n=100)
+
+    return percentiles[49], percentiles[98]
+
+
+def cancel_tasks(loop: asyncio.AbstractEventLoop):
+    """Отменить и дождаться оставшиеся задачи loop (таймеры и т.п.)."""
+
+    if tasks := asyncio.all_tasks(loop):
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+
+def create_handler(
+    data_path: Path,
+    client: FakeTelegramClient | None = None,
+    **kwargs
+) -> tuple[FakeTelegramClient, SmokerBotHandler]:
+    """Создать хендлер с локальным клиентом и обработчиками событий."""
+
+    client = client or FakeTelegramClient()
+    handler = SmokerBotHandler(
+        client,
+        logging.getLogger('smokerbot'),
+        data_path=data_path,
+        admin_ids=[ADMIN_USER_ID],
+        **kwargs
+    )
+
+    # NB: регистрация обработчиков - как в runner.py
+    client.add_event_handler(
+        handler.on_new_message,
+        events.NewMessage(incoming=True, func=handler.filter_event)
+    )
+    client.add_event_handler(
+        handler.on_callback_query,
+        events.CallbackQuery(func=handler.filter_event)
+    )
+
+    return client, handler
+
+
+async def generate_load(
+    client: FakeTelegramClient,
+    n_users: int,
+    n_rounds: int
+) -> tuple[list[float], int]:
+    """Прогнать `LOAD_SCRIPT` `n_rounds` раз для `n_users` пользователей.
+
+    События разных пользователей перемежаются и передаются обработчикам
+    последовательно (как при `sequential_updates=True`).
+
+    Возвращает латентности обработанных событий, сек, и кол-во
+    отброшенных диспетчером событий.
+    """
+
+    latencies = []
+    futures = []
+    n_dropped = 0
+
+    def on_done(future: asyncio.Future, started_at: float):
+        latencies.append(perf_counter() - started_at)
+
+    for _ in range(n_rounds):
+        for kind, data in LOAD_SCRIPT:
+            for user_id in range(
+                LOAD_FIRST_USER_ID, LOAD_FIRST_USER_ID + n_users
+            ):
+                event = (
+                    client.new_message(user_id, data) if kind == 'message'
+                    else client.callback_query(user_id, data)
+                )
+
+                started_at = perf_counter()
+
+                for future in await client.dispatch(event):
+                    if future is None:
+                        n_dropped += 1
+                        continue
+                    future.add_done_callback(
+                        lambda f, t=started_at: on_done(f, t)
+                    )
+                    futures.append(future)
+
+    await asyncio.gather(*futures, return_exceptions=True)
+
+    return latencies, n_dropped
+
+
+def run_load(args: argparse.Namespace):
+    """Бенчмарк `load`: пропускная способность и латентность хендлера."""
+
+    loop = new_event_loop(
+        logging.getLogger('smokerbot'),
+        implementation=args.loop,
+        eager_tasks=args.eager_tasks
+    )
+
+    if args.trace_rate:
+        tracing.configure(args.trace_rate, args.trace_path)
+
+    with tempfile.TemporaryDirectory() as data_path:
+        client, handler = create_handler(
+            Path(data_path),
+            FakeTelegramClient(loop=loop, latency=args.latency),
+            max_concurrency=args.max_concurrency,
+            max_pending=args.max_pending
+        )
+
+        started_at = perf_counter()
+        latencies, n_dropped = client.loop.run_until_complete(
+            generate_load(client, args.users, args.rounds)
+        )
+        elapsed = perf_counter() - started_at
+
+        handler.shutdown()
+        cancel_tasks(client.loop)
+
+    tracing.shutdown()
+
+    n_events = args.users * args.rounds * len(LOAD_SCRIPT)
+    p50, p99 = get_percentiles(latencies)
+
+    print(
+        f'loop:        {type(loop).__module__}.{type(loop).__name__}, '
+        f'task factory: {getattr(loop.get_task_factory(), "__name__", None)}\n'
+        f'events:      {n_events} ({args.users} users x {args.rounds} rounds '
+        f'x {len(LOAD_SCRIPT)} steps), dropped: {n_dropped}\n'
+        f'elapsed:     {elapsed:.2f} s\n'
+        f'throughput:  {n_events / elapsed:.0f} events/s\n'
+        f'latency p50: {p50 * 1000:.2f} ms\n'
+        f'latency p99: {p99 * 1000:.2f} ms\n'
+        f'client calls: {len(client.calls)}\n'
+        f'peak RSS:    {get_peak_rss_mb():.1f} MB'
+    )
+
+
+async def arm_timers(
+    client: FakeTelegramClient,
+    handler: SmokerBotHandler,
+    n_users: int,
+    seed: int
+) -> tuple[dict[int, int], int]:
+    """Запустить таймеры (режим `auto`) для `n_users` пользователей.
+
+    Объекты пользователей создаются, как при получении событий, и
+    освобождаются после запуска таймеров.
+
+    Возвращает интервалы пользователей `{user_id: interval}`, мин, и объем
+    памяти, удерживаемой запущенными таймерами (данные пользователей не
+    учитываются), байт.
+    """
+
+    rng = random.Random(seed)
+    intervals = {}
+
+    for user_id in range(LOAD_FIRST_USER_ID, LOAD_FIRST_USER_ID + n_users):
+        userdata = handler._get_or_create_userdata(user_id)
+        userdata.mode = 'auto'
+        userdata.interval = intervals[user_id] = rng.choice(TIMER_INTERVALS)
+        userdata.is_running = True
+        userdata.ran_at = handler._clock.time()
+        userdata.sig_available = userdata.initial_sig = 0
+
+    tracemalloc.start()
+
+    users = [client.make_user(user_id) for user_id in intervals]
+    for user in users:
+        handler._set_timer(user.id, user)
+    del users, user
+
+    # Задачи запускаются и засыпают на следующей итерации loop
+    await asyncio.sleep(0)
+    memory, _ = tracemalloc.get_traced_memory()
+
+    tracemalloc.stop()
+
+    return intervals, memory
+
+
+def run_timers(args: argparse.Namespace):
+    """Бенчмарк `timers`: симуляция таймеров на виртуальных часах.
+
+    Таймеры `args.users` пользователей работают `args.hours` виртуальных
+    часов. Проверяется, что `sig_available` каждого пользователя равно
+    числу полных интервалов за время симуляции.
+    """
+
+    clock = VirtualClock(track_lateness=True)
+
+    with tempfile.TemporaryDirectory() as data_path:
+        client, handler = create_handler(
+            Path(data_path),
+            FakeTelegramClient(record_calls=False),
+            clock=clock
+        )
+
+        intervals, memory = client.loop.run_until_complete(
+            arm_timers(client, handler, args.users, args.seed)
+        )
+
+        started_at, cpu_started_at = perf_counter(), process_time()
+        client.loop.run_until_complete(
+            clock.advance(args.hours * const.SECONDS_IN_HOUR)
+        )
+        elapsed = perf_counter() - started_at
+        cpu_per_wakeup = (
+            (process_time() - cpu_started_at) / clock.n_wakeups
+            if clock.n_wakeups else 0
+        )
+
+        n_mismatched = sum(
+            handler._users[user_id].sig_available
+            != args.hours * const.SECONDS_IN_HOUR // (
+                interval * const.SECONDS_IN_MINUTE
+            )
+            or not handler._users[user_id].is_running
+            for user_id, interval in intervals.items()
+        )
+
+        handler.shutdown()
+        cancel_tasks(client.loop)
+
+    n_armed = len(intervals)
+    p50, p99 = get_percentiles(clock.lateness)
+
+    print(
+        f'timers:      {n_armed} armed, '
+        f'{args.hours} virtual hours\n'
+        f'wakeups:     {clock.n_wakeups} in {elapsed:.2f} s '
+        f'({clock.n_wakeups / elapsed:.0f} wakeups/s)\n'
+        f'CPU:         {cpu_per_wakeup * 1e6:.1f} us per wakeup\n'
+        f'memory:      {memory / n_armed if n_armed else 0:.0f} B '
+        f'per armed timer\n'
+        f'lateness:    p50 {p50:.3f} s, p99 {p99:.3f} s, '
+        f'max {max(clock.lateness, default=0):.3f} s (virtual)\n'
+        f'sig_available mismatches: {n_mismatched}\n'
+        f'peak RSS:    {get_peak_rss_mb():.1f} MB'
+    )
+
+
+async def replay_recording(
+    client: FakeTelegramClient,
+    clock: VirtualClock,
+    path: Path,
+    speed: float
+) -> tuple[list[float], int, int, float]:
+    """Передать обработчикам события из записи `UpdateRecorder`.
+
+    Интервалы между событиями (по POSIX времени записи) выдерживаются в
+    реальном времени с ускорением `speed` (0 - без пауз), виртуальные часы
+    хендлера сдвигаются на исходные интервалы, т.е. таймеры срабатывают как
+    при записи.
+
+    Возвращает латентности обработанных событий, сек, кол-во событий,
+    отброшенных событий и длительность записи, сек.
+    """
+
+    latencies = []
+    futures = []
+    n_events = n_dropped = 0
+    user_ids = {}
+    first_recorded_at = recorded_at = None
+
+    def on_done(future: asyncio.Future, started_at: float):
+        latencies.append(perf_counter() - started_at)
+
+    for record in read_recording(path):
+        if recorded_at is None:
+            first_recorded_at = recorded_at = record['t']
+        elif (delay := record['t'] - recorded_at) > 0:
+            if speed:
+                await asyncio.sleep(delay / speed)
+            await clock.advance(delay)
+            recorded_at = record['t']
+
+        # Отправители нумеруются по порядку появления в записи
+        user_id = user_ids.setdefault(
+            record['u'], LOAD_FIRST_USER_ID + len(user_ids)
+        )
+        event = (
+            client.new_message(user_id, record['x'])
+            if record['k'] == RECORD_KIND_MESSAGE
+            else client.callback_query(user_id, record['x'])
+        )
+
+        n_events += 1
+        started_at = perf_counter()
+
+        for future in await client.dispatch(event):
+            if future is None:
+                n_dropped += 1
+                continue
+            future.add_done_callback(
+                lambda f, t=started_at: on_done(f, t)
+            )
+            futures.append(future)
+
+    await asyncio.gather(*futures, return_exceptions=True)
+
+    return (
+        latencies,
+        n_events,
+        n_dropped,
+        recorded_at - first_recorded_at if n_events else 0.
+    )
+
+
+def run_replay(args: argparse.Namespace):
+    """Бенчмарк `replay`: воспроизведение записанного трафика.
+
+    Отчет: латентность хендлера и кол-во исходящих вызовов клиента по
+    методам - для сравнения версий на одном и том же трафике.
+    """
+
+    clock = VirtualClock()
+
+    with tempfile.TemporaryDirectory() as data_path:
+        client, handler = create_handler(
+            Path(data_path),
+            FakeTelegramClient(record_calls=False, clock=clock),
+            clock=clock
+        )
+
+        started_at = perf_counter()
+        latencies, n_events, n_dropped, duration = (
+            client.loop.run_until_complete(
+                replay_recording(client, clock, args.recording, args.speed)
+            )
+        )
+        elapsed = perf_counter() - started_at
+
+        handler.shutdown()
+        cancel_tasks(client.loop)
+
+    p50, p99 = get_percentiles(latencies)
+
+    print(
+        f'recording:   {args.recording}, {n_events} events, '
+        f'{duration:.0f} s recorded\n'
+        f'replayed:    in {elapsed:.2f} s (speed '
+        f'{args.speed or "max"}), dropped: {n_dropped}\n'
+        f'throughput:  {n_events / elapsed:.0f} events/s\n'
+        f'latency p50: {p50 * 1000:.2f} ms\n'
+        f'latency p99: {p99 * 1000:.2f} ms\n'
+        f'client calls:\n'
+        + '\n'.join(
+            f'    {method:<24} {n}'
+            for method, n in sorted(client.n_calls.items())
+        )
+    )
+
+
+def run_traces(args: argparse.Namespace):
+    """Анализ трасс (`TRACE_PATH`): самые медленные задачи и спаны.
+
+    Для `args.top` самых медленных трасс выводится дерево спанов, для
+    каждого метода - кол-во вызовов, p50/p99 длительности и ошибки.
+    """
+
+    traces: dict[str, list[dict]] = {}
+    for span in tracing.read_spans(args.traces):
+        traces.setdefault(span['trace'], []).append(span)
+
+    roots = sorted(
+        (
+            (root, spans) for spans in traces.values()
+            for root in spans if root['parent'] is None
+        ),
+        key=lambda item: -item[0]['ms']
+    )
+
+    print(
+        f'traces: {len(traces)}, spans: '
+        f'{sum(len(spans) for spans in traces.values())}\n'
+    )
+
+    for root, spans in roots[:args.top]:
+        children: dict[int, list[dict]] = {}
+        for span in spans:
+            children.setdefault(span['parent'], []).append(span)
+
+        print(
+            f'{root["task"]} [ {root["trace"]} ] {root["ms"]:.1f} ms, '
+            f'client calls: '
+            f'{sum(s["kind"] == tracing.SPAN_KIND_CLIENT for s in spans)}'
+        )
+
+        stack = [(root, 1)]
+        while stack:
+            span, level = stack.pop()
+            print(
+                f'{"    " * level}{span["name"]:<36} {span["ms"]:>9.1f} ms'
+                + (f'  {span["outcome"]}' if span['outcome'] != 'ok' else '')
+            )
+            stack.extend(
+                (child, level + 1) for child in sorted(
+                    children.get(span['span'], ()),
+                    key=lambda child: -child['start']
+                )
+            )
+        print()
+
+    durations: dict[str, list[float]] = {}
+    n_errors = Counter()
+    for spans in traces.values():
+        for span in spans:
+            durations.setdefault(span['name'], []).append(span['ms'])
+            n_errors[span['name']] += (
+                span['outcome'] != tracing.SPAN_OUTCOME_OK
+            )
+
+    print(
+        f'{"span":<36} {"calls":>7} {"p50 ms":>8} {"p99 ms":>8} '
+        f'{"not ok":>7}'
+    )
+    for name, values in sorted(
+        durations.items(), key=lambda item: -sum(item[1])
+    ):
+        p50, p99 = get_percentiles(values)
+        print(
+            f'{name:<36} {len(values):>7} {p50:>8.2f} {p99:>8.2f} '
+            f'{n_errors[name]:>7}'
+        )
+
+
+class CountingLogHandler(logging.Handler):
+    """Обработчик логов, считающий записи по уровням."""
+
+    def __init__(self):
+        super().__init__()
+        self.counts = Counter()
+
+    def emit(self, record: logging.LogRecord):
+        self.counts[record.levelname] += 1
+
+
+async def dispatch_soak_event(
+    client: FakeTelegramClient,
+    kind: str,
+    user_id: int,
+    data: str
+) -> bool:
+    """Передать событие обработчикам, `False` - если не дождались очереди."""
+
+    event = (
+        client.new_message(user_id, data) if kind == 'message'
+        else client.callback_query(user_id, data)
+    )
+
+    try:
+        await asyncio.wait_for(client.dispatch(event), SOAK_DISPATCH_TIMEOUT)
+    except TimeoutError:
+        return False
+
+    return True
+
+
+async def run_soak_simulation(
+    client: FakeTelegramClient,
+    handler: SmokerBotHandler,
+    clock: VirtualClock,
+    args: argparse.Namespace,
+    fault_rates: dict[str, float]
+) -> dict:
+    """Симуляция: пользователи запускают таймеры и случайно действуют.
+
+    Ошибки внедряются после запуска таймеров, по окончании симуляции
+    отключаются и очереди диспетчера дорабатываются.
+
+    Возвращает счетчики симуляции и замеры RSS (МБ) по виртуальным часам.
+    """
+
+    rng = random.Random(args.seed)
+    user_ids = range(LOAD_FIRST_USER_ID, LOAD_FIRST_USER_ID + args.users)
+    process = psutil.Process()
+    counts = Counter()
+
+    for user_id in user_ids:
+        for data in ('/start', '/run'):
+            counts['events'] += 1
+            counts['stalled'] += not await dispatch_soak_event(
+                client, 'message', user_id, data
+            )
+
+    client.fault_rates = fault_rates
+    rss_mb = [process.memory_info().rss / (1024 ** 2)]
+
+    for step in range(args.hours * const.SECONDS_IN_HOUR // SOAK_STEP):
+        for user_id in user_ids:
+            if rng.random() < args.action_rate:
+                kind, data = rng.choice(SOAK_ACTIONS)
+                counts['events'] += 1
+                counts['stalled'] += not await dispatch_soak_event(
+                    client, kind, user_id, data
+                )
+
+        await clock.advance(SOAK_STEP)
+
+        if not (step + 1) % (const.SECONDS_IN_HOUR // SOAK_STEP):
+            rss_mb.append(process.memory_info().rss / (1024 ** 2))
+
+    # Дорабатываем очереди без ошибок: ожидания FloodWait, разрывы связи
+    client.fault_rates = {}
+    dispatcher = handler._dispatcher
+    for _ in range(FAULT_FLOOD_WAIT_MAX):
+        if not (dispatcher.n_pending or dispatcher.n_running):
+            break
+        await clock.advance(1)
+        await asyncio.sleep(client.latency)
+
+    return counts | {'rss_mb': rss_mb}
+
+
+async def get_soak_report(
+    handler: SmokerBotHandler,
+    clock: VirtualClock
+) -> dict:
+    """Проверить состояние хендлера после soak-теста.
+
+    Возвращает:
+        - `leaked_tasks` - задачи, которых не должно быть: лишние таймеры и
+        прочие задачи, кроме постоянных (`SOAK_BACKGROUND_TASKS`)
+        - `stuck_users` - пользователи с запущенным таймером без задачи
+        wakeup или с просроченным таймером, а также пользователи с
+        необработанными событиями в очереди диспетчера
+
+    NB: `is_active_user` не учитывается - пользователь, заблокировавший
+    бота, может снова запустить таймер (признак восстанавливает /start).
+    """
+
+    tasks = [
+        task for task in asyncio.all_tasks(handler._loop)
+        if task is not asyncio.current_task()
+    ]
+    wakeup_names = Counter(
+        task.get_name() for task in tasks
+        if task.get_name().startswith('wakeup @')
+    )
+
+    armed_users = {
+        user_id for user_id, userdata in handler._users.items()
+        if userdata.is_running and userdata.is_timer
+    }
+    expected_names = {
+        helpers.get_wakeup_task_name(user_id) for user_id in armed_users
+    }
+
+    leaked_tasks = sum(
+        n - (name in expected_names) for name, n in wakeup_names.items()
+    ) + sum(
+        not task.get_name().startswith('wakeup @')
+        and not task.get_coro().__qualname__.endswith(SOAK_BACKGROUND_TASKS)
+        for task in tasks
+    )
+
+    stuck_users = {
+        user_id for user_id in armed_users
+        if helpers.get_wakeup_task_name(user_id) not in wakeup_names
+        or handler._users[user_id].timer_end < clock.time() - SOAK_STEP
+    } | set(handler._dispatcher._queues)
+
+    return {'leaked_tasks': leaked_tasks, 'stuck_users': len(stuck_users)}
+
+
+def run_soak(args: argparse.Namespace):
+    """Soak-тест: ошибки Telegram, задержки и разрывы связи.
+
+    Пользователи (`args.users`) запускают таймеры и `args.hours`
+    виртуальных часов случайно действуют (`SOAK_ACTIONS`), клиент внедряет
+    ошибки с заданной вероятностью на вызов. Отчет: утекшие задачи,
+    зависшие пользователи, рост памяти.
+    """
+
+    clock = VirtualClock()
+    client = FakeTelegramClient(
+        record_calls=False, latency=args.latency, clock=clock, seed=args.seed
+    )
+    fault_rates = {
+        FAULT_FLOOD_WAIT: args.flood_wait_rate,
+        FAULT_BLOCKED: args.blocked_rate,
+        FAULT_NOT_MODIFIED: args.not_modified_rate,
+        FAULT_DISCONNECT: args.disconnect_rate,
+    }
+
+    # Ошибки считаются, в консоль выводятся только по запросу
+    logger = logging.getLogger('smokerbot')
+    logger.addHandler(log_counter := CountingLogHandler())
+    logger.propagate = args.show_errors
+
+    with tempfile.TemporaryDirectory() as data_path:
+        client, handler = create_handler(Path(data_path), client, clock=clock)
+
+        started_at = perf_counter()
+        counts = client.loop.run_until_complete(
+            run_soak_simulation(client, handler, clock, args, fault_rates)
+        )
+        elapsed = perf_counter() - started_at
+
+        report = client.loop.run_until_complete(
+            get_soak_report(handler, clock)
+        )
+
+        handler.shutdown()
+        cancel_tasks(client.loop)
+
+    rss_mb = counts['rss_mb']
+
+    print(
+        f'users:        {args.users}, {args.hours} virtual hours '
+        f'in {elapsed:.1f} s\n'
+        f'events:       {counts["events"]}, '
+        f'stalled (backpressure): {counts["stalled"]}, '
+        f'dropped: {sum(handler._dispatcher.shed_counts.values())}\n'
+        f'faults:       {dict(client.n_faults)}\n'
+        f'log records:  {dict(log_counter.counts)}\n'
+        f'wakeups:      {clock.n_wakeups}\n'
+        f'leaked tasks: {report["leaked_tasks"]}\n'
+        f'stuck users:  {report["stuck_users"]}\n'
+        f'outbox:       {handler._outbox.n_pending} pending, '
+        f'{handler._outbox.n_delivered} delivered, '
+        f'{handler._outbox.n_dropped} dropped\n'
+        f'memory:       RSS {rss_mb[0]:.1f} -> {rss_mb[-1]:.1f} MB '
+        f'({(rss_mb[-1] - rss_mb[0]) / max(len(rss_mb) - 1, 1):+.2f} MB '
+        f'per virtual hour)'
+    )
+
+
+def get_hotpath_benchmarks(
+    client: FakeTelegramClient,
+    handler: SmokerBotHandler
+) -> dict:
+    """Получить микробенчмарки пути обработки события.
+
+    Возвращает словарь `{name: (callable, context)}`, callable вызывается
+    без аргументов в контексте `context`.
+    """
+
+    def noop(self):
+        pass
+
+    # Контекст обработчика: пользователь с запущенным таймером
+    user_id = LOAD_FIRST_USER_ID
+    userdata = handler._get_or_create_userdata(user_id)
+    userdata.is_running = userdata.is_timer = True
+    userdata.ran_at = userdata.timer_start = time()
+    userdata.timer_end = time() + userdata.interval * const.SECONDS_IN_MINUTE
+
+    event = client.new_message(user_id, '/status')
+    group_event = client.new_message(user_id, 'hello', is_private=False)
+    ctx = Context()
+    ctx.run(context.init_contextvars, task_name_val='bench', event_val=event)
+
+    manage_context_noop = BaseHandler.manage_context(noop)
+    new_context_noop = BaseHandler.new_context('bench')(manage_context_noop)
+
+    return {
+        'new_context+manage_context': (
+            lambda: new_context_noop(handler), Context()
+        ),
+        'manage_context': (lambda: manage_context_noop(handler), ctx),
+        'init_contextvars': (
+            lambda: Context().run(
+                context.init_contextvars,
+                task_name_val='bench',
+                event_val=event
+            ),
+            Context()
+        ),
+        'filter_event[rejected]': (
+            lambda: handler.filter_event(group_event), Context()
+        ),
+        'get_command_from_string': (
+            lambda: helpers.get_command_from_string('/setinterval 45'),
+            Context()
+        ),
+        'get_command_from_string[miss]': (
+            lambda: helpers.get_command_from_string('hello'), Context()
+        ),
+        'get_callback_command_from_string': (
+            lambda: helpers.get_callback_command_from_string(
+                'setinterval adjust 45'
+            ),
+            Context()
+        ),
+        '_build_status_msg': (handler._build_status_msg, ctx),
+        '_build_setinterval_msg': (
+            lambda: handler._build_setinterval_msg(45), ctx
+        ),
+        '_build_setmode_msg': (
+            lambda: handler._build_setmode_msg('manual'), ctx
+        ),
+        '_build_setinitial_msg': (
+            lambda: handler._build_setinitial_msg(2), ctx
+        ),
+        '_build_settz_msg': (lambda: handler._build_settz_msg(3), ctx),
+        '_get_or_create_userdata': (handler._get_or_create_userdata, ctx),
+        '_resolve_userdata': (handler._resolve_userdata, ctx),
+    }
+
+
+def get_git_revision() -> str | None:
+    """Текущий коммит git (репозитория bench.py), если доступен."""
+
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_latest_result(name: str) -> Path | None:
+    """Последний сохраненный результат бенчмарка `name`, если есть."""
+
+    if results := sorted(BENCH_RESULTS_PATH.glob(f'{name}_*.json')):
+        return results[-1]
+
+
+def run_hotpath(args: argparse.Namespace):
+    """Бенчмарк `hotpath`: микробенчмарки пути обработки события.
+
+    Результаты (нс на вызов, лучший из `HOTPATH_REPEAT` замеров)
+    сохраняются в `logs/bench/hotpath_<дата>_<коммит>.json` и сравниваются
+    с предыдущим сохраненным (или указанным `--compare`) результатом.
+    """
+
+    baseline_path = args.compare or get_latest_result('hotpath')
+
+    with tempfile.TemporaryDirectory() as data_path:
+        client, handler = create_handler(Path(data_path))
+
+        results = {}
+        for name, (func, ctx) in get_hotpath_benchmarks(
+            client, handler
+        ).items():
+            timer = timeit.Timer(func)
+            n_calls, _ = ctx.run(timer.autorange)
+            results[name] = {
+                'ns_per_call': min(
+                    ctx.run(timer.repeat, HOTPATH_REPEAT, n_calls)
+                ) / n_calls * 1e9,
+                'n_calls': n_calls,
+            }
+
+    revision = get_git_revision()
+    output_path = args.output or BENCH_RESULTS_PATH / (
+        f'hotpath_{datetime.now():%Y%m%d_%H%M%S}_{revision}.json'
+    )
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(
+        json.dumps(
+            {
+                'benchmark': 'hotpath',
+                'revision': revision,
+                'date': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'results': results,
+            },
+            indent=4
+        )
+    )
+
+    baseline = (
+        json.loads(baseline_path.read_text())['results'] if baseline_path
+        else {}
+    )
+
+    for name, result in results.items():
+        line = f'{name:<36} {result["ns_per_call"]:>12.0f} ns'
+
+        if base := baseline.get(name):
+            change = result['ns_per_call'] / base['ns_per_call'] - 1
+            line += f'  {change:>+7.1%}' + (
+                '  regression' if change > HOTPATH_CHANGE_THRESHOLD
+                else '  improvement' if change < -HOTPATH_CHANGE_THRESHOLD
+                else ''
+            )
+
+        print(line)
+
+    print(
+        f'\nsaved to {output_path}'
+        + (f', compared with {baseline_path}' if baseline_path else '')
+    )
+
+
+async def count_lookups(
+    client: FakeTelegramClient,
+    handler: SmokerBotHandler
+) -> list[tuple[str, int, int]]:
+    """Подсчитать обращения к данным пользователя при обработке команд.
+
+    Команды `LOAD_SCRIPT` обрабатываются по одной. Возвращает список
+    `(команда, обращения, поиски)`, где `поиски` - обращения, не попавшие в
+    memo контекста запроса.
+    """
+
+    n_calls = Counter()
+
+    def counting(name, method):
+        def wrapper(*args, **kwargs):
+            n_calls[name] += 1
+            return method(*args, **kwargs)
+        return wrapper
+
+    # NB: атрибуты экземпляра перекрывают методы класса
+    for name in ('_get_or_create_userdata', '_resolve_userdata'):
+        setattr(handler, name, counting(name, getattr(handler, name)))
+
+    results = []
+
+    for kind, data in LOAD_SCRIPT:
+        n_calls.clear()
+        event = (
+            client.new_message(LOAD_FIRST_USER_ID, data) if kind == 'message'
+            else client.callback_query(LOAD_FIRST_USER_ID, data)
+        )
+        await asyncio.gather(
+            *(f for f in await client.dispatch(event) if f is not None)
+        )
+        results.append(
+            (
+                data,
+                n_calls['_get_or_create_userdata'],
+                n_calls['_resolve_userdata']
+            )
+        )
+
+    return results
+
+
+def run_lookups(args: argparse.Namespace):
+    """Бенчмарк `lookups`: обращения к данным пользователя на команду."""
+
+    with tempfile.TemporaryDirectory() as data_path:
+        client, handler = create_handler(Path(data_path))
+
+        # Стоимость обращения: memo контекста и поиск с `manage_context`
+        event = client.new_message(LOAD_FIRST_USER_ID, '/status')
+        ctx = Context()
+        ctx.run(
+            context.init_contextvars, task_name_val='bench', event_val=event
+        )
+        ns_per_call = {}
+        for name, func in (
+            ('memo', handler._get_or_create_userdata),
+            ('lookup', handler._resolve_userdata),
+        ):
+            timer = timeit.Timer(func)
+            n_calls, _ = ctx.run(timer.autorange)
+            ns_per_call[name] = min(
+                ctx.run(timer.repeat, HOTPATH_REPEAT, n_calls)
+            ) / n_calls * 1e9
+
+        results = client.loop.run_until_complete(
+            count_lookups(client, handler)
+        )
+
+        handler.shutdown()
+        cancel_tasks(client.loop)
+
+    print(f'{"command":<24} {"lookups":>8} {"resolved":>8}')
+    for command, n_lookups, n_resolved in results:
+        print(f'{command:<24} {n_lookups:>8} {n_resolved:>8}')
+    print(
+        f'\nper lookup: memo {ns_per_call["memo"]:.0f} ns, '
+        f'manage_context + dict {ns_per_call["lookup"]:.0f} ns'
+    )
+
+
+def get_import_times(module: str) -> dict[str, tuple[int, int, int]]:
+    """Время импорта модуля в новом процессе (`python -X importtime`).
+
+    Возвращает словарь `{module: (level, self_us, cumulative_us)}`, где
+    `level` - уровень вложенности импорта (0 - импортирован напрямую).
+    """
+
+    stderr = subprocess.run(
+        (sys.executable, '-X', 'importtime', '-c', f'import {module}'),
+        cwd=Path(__file__).parent,
+        capture_output=True, text=True, check=True
+    ).stderr
+
+    import_times = {}
+
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix(
+            'import time:'
+        ).split('|')
+        import_times[name.strip()] = (
+            (len(name) - len(name.lstrip()) - 1) // 2,
+            int(self_us),
+            int(cumulative_us)
+        )
+
+    return import_times
+
+
+def run_importtime(args: argparse.Namespace):
+    """Бенчмарк `importtime`: время импорта в сравнении с бюджетом.
+
+    Проверяет также, что зависимости `IMPORT_TIME_LAZY_MODULES` не
+    импортируются при старте. Код выхода 1 - бюджет превышен или найден
+    неленивый импорт.
+    """
+
+    runs = [
+        get_import_times(IMPORT_TIME_MODULE)
+        for _ in range(IMPORT_TIME_REPEAT)
+    ]
+    total_ms = [
+        sum(
+            cumulative for level, _, cumulative in import_times.values()
+            if not level
+        ) / 1000
+        for import_times in runs
+    ]
+    best = runs[total_ms.index(min(total_ms))]
+
+    eager_lazy_modules = sorted(
+        name for name in best
+        if name.split('.')[0] in IMPORT_TIME_LAZY_MODULES
+        and '.' not in name
+    )
+
+    print(
+        f'import {IMPORT_TIME_MODULE}: {min(total_ms):.1f} ms '
+        f'(best of {IMPORT_TIME_REPEAT}), budget {args.budget_ms} ms\n'
+        f'heaviest imports (cumulative):'
+    )
+    for name, (level, _, cumulative) in sorted(
+        ((name, times) for name, times in best.items() if times[0] <= 1),
+        key=lambda item: -item[1][2]
+    )[:args.top]:
+        print(f'    {"  " * level}{name:<40} {cumulative / 1000:>8.1f} ms')
+
+    if eager_lazy_modules:
+        print(f'eagerly imported: {", ".join(eager_lazy_modules)}')
+
+    if min(total_ms) > args.budget_ms or eager_lazy_modules:
+        print('FAIL')
+        sys.exit(1)
+
+    print('OK')
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Парсер аргументов командной строки."""
+
+    parser = argparse.ArgumentParser(
+        description='Бенчмарки хендлера бота без подключения к Telegram'
+    )
+    parser.add_argument(
+        '--log-level', default='WARNING', help='уровень логгирования'
+    )
+    subparsers = parser.add_subparsers(required=True)
+
+    load = subparsers.add_parser(
+        'load', help='генератор нагрузки: events/s, p50/p99, peak RSS'
+    )
+    load.add_argument('--users', type=int, default=1000)
+    load.add_argument('--rounds', type=int, default=3)
+    load.add_argument('--max-concurrency', type=int,
+                      default=const.DISPATCHER_MAX_CONCURRENCY)
+    load.add_argument('--max-pending', type=int,
+                      default=const.DISPATCHER_MAX_PENDING)
+    load.add_argument(
+        '--latency', type=float, default=0.,
+        help='макс. задержка вызова клиента, сек'
+    )
+    load.add_argument('--loop', choices=const.EVENT_LOOP_IMPLEMENTATIONS,
+                      default=const.EVENT_LOOP_DEFAULT,
+                      help='реализация event loop')
+    load.add_argument('--eager-tasks', action='store_true',
+                      help='eager task factory (Python 3.12+)')
+    load.add_argument('--trace-rate', type=float, default=0.,
+                      help='доля трассируемых задач')
+    load.add_argument('--trace-path', type=Path,
+                      default=Path(const.TRACE_PATH),
+                      help='файл спанов трассировки (JSONL)')
+    load.set_defaults(run=run_load)
+
+    timers = subparsers.add_parser(
+        'timers', help='симуляция таймеров на виртуальных часах'
+    )
+    timers.add_argument('--users', type=int, default=10_000)
+    timers.add_argument('--hours', type=int, default=8)
+    timers.add_argument('--seed', type=int, default=0)
+    timers.set_defaults(run=run_timers)
+
+    soak = subparsers.add_parser(
+        'soak', help='soak-тест с внедрением ошибок Telegram'
+    )
+    soak.add_argument('--users', type=int, default=2000)
+    soak.add_argument('--hours', type=int, default=24)
+    soak.add_argument(
+        '--action-rate', type=float, default=0.02,
+        help='вероятность действия пользователя в минуту'
+    )
+    soak.add_argument(
+        '--latency', type=float, default=0.,
+        help='макс. задержка вызова клиента, сек реального времени'
+    )
+    soak.add_argument('--flood-wait-rate', type=float, default=0.001)
+    soak.add_argument('--blocked-rate', type=float, default=0.0005)
+    soak.add_argument('--not-modified-rate', type=float, default=0.05)
+    soak.add_argument('--disconnect-rate', type=float, default=0.0001)
+    soak.add_argument('--seed', type=int, default=0)
+    soak.add_argument(
+        '--show-errors', action='store_true',
+        help='выводить логи ошибок хендлера'
+    )
+    soak.set_defaults(run=run_soak)
+
+    replay = subparsers.add_parser(
+        'replay', help='воспроизведение записи входящих обновлений'
+    )
+    replay.add_argument(
+        'recording', type=Path, help='файл записи (RECORD_UPDATES_PATH)'
+    )
+    replay.add_argument(
+        '--speed', type=float, default=0,
+        help='ускорение относительно записи (1 - реальное время, 0 - макс.)'
+    )
+    replay.set_defaults(run=run_replay)
+
+    traces = subparsers.add_parser(
+        'traces', help='анализ трасс: медленные задачи и спаны'
+    )
+    traces.add_argument(
+        'traces', type=Path, help='файл спанов (TRACE_PATH)'
+    )
+    traces.add_argument('--top', type=int, default=3)
+    traces.set_defaults(run=run_traces)
+
+    importtime = subparsers.add_parser(
+        'importtime', help='время импорта и бюджет'
+    )
+    importtime.add_argument(
+        '--budget-ms', type=float, default=IMPORT_TIME_BUDGET_MS
+    )
+    importtime.add_argument('--top', type=int, default=10)
+    importtime.set_defaults(run=run_importtime)
+
+    hotpath = subparsers.add_parser(
+        'hotpath', help='микробенчмарки пути обработки события'
+    )
+    hotpath.add_argument(
+        '--output', type=Path, help='файл результатов (json)'
+    )
+    hotpath.add_argument(
+        '--compare', type=Path,
+        help='результат для сравнения (по умолчанию - последний сохраненный)'
+    )
+    hotpath.set_defaults(run=run_hotpath)
+
+    lookups = subparsers.add_parser(
+        'lookups', help='обращения к данным пользователя на команду'
+    )
+    lookups.set_defaults(run=run_lookups)
+
+    return parser
+
+
+def bench_runner():
+    """Запуск бенчмарка."""
+
+    args = get_parser().parse_args()
+
+    logging.basicConfig(level=args.log_level)
+
+    args.run(args)
+
+
+if __name__ == '__main__':
+    bench_runner()
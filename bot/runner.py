@@ -1,4 +1,5 @@
 # import asyncio
+import functools
 import logging
 import os
 import signal
@@ -8,7 +9,8 @@ from pathlib import Path
 
 import settings
 from dotenv import load_dotenv
-from smokerbot import SmokerBotHandler
+from smokerbot import SmokerBotHandler, const, tracing
+from smokerbot.eventloop import new_event_loop
 from telethon import TelegramClient, events
 
 
@@ -23,6 +25,23 @@ def bot_runner():
     logger.setLevel(os.getenv('APP_LOG_LEVEL', 'INFO'))
     logger.info('Smokerbot is being started...')
 
+    # Event loop: реализация и фабрика задач (клиент использует текущий loop)
+    new_event_loop(
+        logger,
+        implementation=os.getenv('EVENT_LOOP', const.EVENT_LOOP_DEFAULT),
+        eager_tasks=bool(int(os.getenv('EVENT_LOOP_EAGER_TASKS', 0)))
+    )
+
+    # Трассировка задач хендлера (опционально)
+    if (
+        sample_rate := float(
+            os.getenv('TRACE_SAMPLE_RATE', const.TRACE_SAMPLE_RATE)
+        )
+    ) > 0:
+        trace_path = os.getenv('TRACE_PATH', const.TRACE_PATH)
+        tracing.configure(sample_rate, Path(trace_path))
+        logger.info(f'Tracing {sample_rate:.0%} of tasks to {trace_path}')
+
     # Коннектим Телеграм клиент
     client = TelegramClient(
         Path(os.getenv('DATA_PATH')) / 'smokerbot.session',
@@ -33,7 +52,10 @@ def bot_runner():
         app_version=os.getenv('CLIENT_APP_VERSION'),
         # lang_code=os.getenv('CLIENT_LANG_CODE'),
         # system_lang_code=os.getenv('CLIENT_SYSTEM_LANG_CODE'),
-        connection_retries=int(os.getenv('CLIENT_CONNECTION_RETRIES'))
+        connection_retries=int(os.getenv('CLIENT_CONNECTION_RETRIES')),
+        # Обновления передаются обработчикам последовательно, параллельная
+        # обработка и backpressure обеспечиваются диспетчером хендлера
+        sequential_updates=True
     )
     client.session.set_dc(
         int(os.getenv('CLIENT_DC')),
@@ -52,7 +74,32 @@ def bot_runner():
         logger,
         data_path=Path(os.getenv('DATA_PATH')),
         admin_ids=[int(os.getenv('ADMIN_USER_ID'))],
-        persistence_interval=int(os.getenv('PERSISTENCE_INTERVAL', 600))
+        persistence_interval=int(os.getenv('PERSISTENCE_INTERVAL', 600)),
+        max_concurrency=int(
+            os.getenv('DISPATCHER_MAX_CONCURRENCY',
+                      const.DISPATCHER_MAX_CONCURRENCY)
+        ),
+        max_pending=int(
+            os.getenv('DISPATCHER_MAX_PENDING', const.DISPATCHER_MAX_PENDING)
+        ),
+        max_user_pending=int(
+            os.getenv('DISPATCHER_MAX_USER_PENDING',
+                      const.DISPATCHER_MAX_USER_PENDING)
+        ),
+        shed_policies=(
+            tuple(p.strip() for p in policies.split(',') if p.strip())
+            if (policies := os.getenv('SHED_POLICIES')) is not None
+            else const.SHED_POLICIES_DEFAULT
+        ),
+        history_retention_days=int(
+            os.getenv('HISTORY_RETENTION_DAYS', const.HISTORY_RETENTION_DAYS)
+        ),
+        history_rollup=os.getenv(
+            'HISTORY_ROLLUP', const.HISTORY_ROLLUP_DEFAULT
+        ),
+        broadcast_rate=float(
+            os.getenv('BROADCAST_RATE', const.BROADCAST_RATE)
+        )
     )
 
     # Регистрируем обработчики событий
@@ -65,6 +112,26 @@ def bot_runner():
         events.CallbackQuery(func=handler.filter_event)
     )
 
+    # Запись входящих обновлений для replay (опционально)
+    recorder = None
+    if record_path := os.getenv('RECORD_UPDATES_PATH'):
+        from smokerbot.recorder import UpdateRecorder
+
+        recorder = UpdateRecorder(
+            Path(record_path), salt=os.getenv('RECORD_UPDATES_SALT')
+        )
+        # NB: повторы записываются - проверка дубликатов выполняется только
+        # фильтром обработчиков бота
+        record_filter = functools.partial(
+            handler.filter_event, check_duplicate=False
+        )
+        for event_builder in (
+            events.NewMessage(incoming=True, func=record_filter),
+            events.CallbackQuery(func=record_filter)
+        ):
+            client.add_event_handler(recorder.on_event, event_builder)
+        logger.info(f'Recording incoming updates to {record_path}')
+
     # Получаем loop и регистрируем сигналы
     # https://www.roguelynn.com/words/asyncio-graceful-shutdowns/
     loop = client.loop
@@ -96,6 +163,9 @@ def bot_runner():
         )
     finally:
         handler.shutdown()
+        if recorder:
+            recorder.close()
+        tracing.shutdown()
         client.disconnect()
 
 
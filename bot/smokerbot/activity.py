@@ -0,0 +1,159 @@
+from collections import Counter
+from collections.abc import Iterable
+
+from . import const
+
+
+class ActivityIndex:
+    """Индекс активности пользователей.
+
+    Поддерживает счетчики, позволяющие получить кол-во активных
+    пользователей и таймеров без перебора всех пользователей:
+        - кол-во пользователей по часовым корзинам `last_seen` и текущее
+        кол-во активных в каждом из периодов `windows` (скользящие окна,
+        сдвигаются при продвижении времени); корзины старше самого
+        длинного периода удаляются
+        - кол-во запущенных (`is_running` и `is_timer`) и поставленных на
+        паузу (`is_running` без `is_timer`) таймеров
+
+    Учитываются только пользователи, не блокировавшие бота. Индекс
+    обновляется методом `update()` после каждого изменения данных
+    пользователя, O(1) (сдвиг окон - амортизированно O(1) на час).
+    """
+
+    def __init__(self, windows: Iterable[int] = const.ACTIVITY_WINDOWS):
+        # Кол-во пользователей по корзинам {номер часа: кол-во}
+        self._buckets: Counter[int] = Counter()
+
+        # Кол-во активных в окне {длина окна, ч: кол-во}
+        self._windows: dict[int, int] = {
+            seconds // const.SECONDS_IN_HOUR: 0 for seconds in windows
+        }
+        self._max_window = max(self._windows)
+
+        # Последняя (текущая) корзина, до которой сдвинуты окна
+        self._now_bucket: int | None = None
+
+        # Учтенное состояние {user_id: (корзина, is_running, is_paused)}
+        self._state: dict[int, tuple[int | None, bool, bool]] = {}
+
+        self.n_running = 0
+        self.n_paused = 0
+
+    def update(self, user_id: int, userdata):
+        """Обновить индекс по текущим данным `UserData` пользователя."""
+
+        if userdata.is_active_user:
+            bucket = (
+                int(userdata.last_seen) // const.SECONDS_IN_HOUR
+                if userdata.last_seen else None
+            )
+            is_running = userdata.is_running and userdata.is_timer
+            is_paused = userdata.is_running and not userdata.is_timer
+            self._set_state(user_id, (bucket, is_running, is_paused))
+        else:
+            self.remove(user_id)
+
+    def remove(self, user_id: int):
+        """Удалить пользователя из индекса."""
+
+        self._set_state(user_id, None)
+
+    def count_active(self, seconds: int, time_now: float) -> int:
+        """Кол-во пользователей, активных в течение `seconds` до `time_now`.
+
+        `seconds` - один из периодов `windows`. Точность - один час
+        (корзина `time_now` учитывается целиком).
+        """
+
+        self._advance(int(time_now) // const.SECONDS_IN_HOUR)
+
+        return self._windows[seconds // const.SECONDS_IN_HOUR]
+
+    def _advance(self, now_bucket: int):
+        """Сдвинуть окна к текущей корзине `now_bucket`.
+
+        Корзины, вышедшие из самого длинного окна, удаляются.
+        """
+
+        if self._now_bucket is None:
+            self._now_bucket = now_bucket
+            return
+
+        if (n_hours := now_bucket - self._now_bucket) <= 0:
+            return
+
+        for window in self._windows:
+            if n_hours < window:
+                # Из окна выходят корзины [старое начало, новое начало)
+                self._windows[window] -= sum(
+                    self._buckets.get(bucket, 0) for bucket in range(
+                        self._now_bucket - window + 1,
+                        now_bucket - window + 1
+                    )
+                )
+            else:
+                # Окно сдвинуто целиком (долгий простой) - пересчет
+                self._windows[window] = sum(
+                    n for bucket, n in self._buckets.items()
+                    if bucket > now_bucket - window
+                )
+
+        expired = (
+            range(
+                self._now_bucket - self._max_window + 1,
+                now_bucket - self._max_window + 1
+            )
+            if n_hours < self._max_window
+            else [
+                bucket for bucket in self._buckets
+                if bucket <= now_bucket - self._max_window
+            ]
+        )
+        for bucket in expired:
+            self._buckets.pop(bucket, None)
+
+        self._now_bucket = now_bucket
+
+    def _set_state(
+        self,
+        user_id: int,
+        state: tuple[int | None, bool, bool] | None
+    ):
+        """Заменить учтенное состояние пользователя, обновив счетчики."""
+
+        old_bucket, was_running, was_paused = (
+            self._state.pop(user_id, None) or (None, False, False)
+        )
+        bucket, is_running, is_paused = state or (None, False, False)
+
+        if bucket is not None:
+            self._advance(bucket)
+
+        if old_bucket != bucket:
+            self._move(old_bucket, -1)
+            self._move(bucket, 1)
+
+        self.n_running += is_running - was_running
+        self.n_paused += is_paused - was_paused
+
+        if state:
+            self._state[user_id] = state
+
+    def _move(self, bucket: int | None, delta: int):
+        """Добавить `delta` пользователей в корзину и окна, содержащие ее.
+
+        NB: удаленные (вышедшие из всех окон) корзины не учитываются.
+        """
+
+        if bucket is None or bucket <= self._now_bucket - self._max_window:
+            return
+
+        if n := self._buckets[bucket] + delta:
+            self._buckets[bucket] = n
+        else:
+            del self._buckets[bucket]
+
+        for window in self._windows:
+            if bucket > self._now_bucket - window:
+                self._windows[window] += delta
@@ -0,0 +1,361 @@
+import asyncio
+import csv
+import json
+import secrets
+from collections.abc import Iterator
+from dataclasses import asdict, fields
+from datetime import datetime
+from time import perf_counter
+
+from . import const, context, helpers
+from .basehandler import BaseHandler
+from .history import RECORD_LEN, ROLLUP_RECORD_LEN
+from .userdatamixin import UserData
+
+
+class AdminMixin:
+    """Команды и задачи администратора бота."""
+
+    new_context = BaseHandler.new_context
+    manage_context = BaseHandler.manage_context
+
+    @manage_context
+    async def _on_command_export(self, **kwargs):
+        """Обработчик команды администратора /export.
+
+        Запускает фоновую задачу экспорта данных пользователей и истории в
+        файл формата `jsonl` (по умолчанию) или `csv`.
+        """
+
+        # Доступно только администратору бота
+        if context.sender_id.get() not in self._admin_ids:
+            return await self._set_reaction_not_understood()
+
+        export_format = (
+            kwargs.get('export_format') or const.EXPORT_FORMAT_DEFAULT
+        )
+
+        await self._send_message(
+            context.sender.get(),
+            const.MSG_EXPORT_STARTED.format(export_format=export_format)
+        )
+
+        # Задача создается в копии текущего контекста
+        self._loop.create_task(self._export_task(export_format))
+
+        self.logger.info(
+            f'{context.get_task_prefix()} /export command handled '
+            f'{const.EMOJI_OK}'
+        )
+
+    @manage_context
+    async def _export_task(self, export_format: str):
+        """Задача потокового экспорта данных в файл в `DATA_PATH/export/`.
+
+        Записи формируются по одной и пишутся в файл порциями по
+        `const.EXPORT_CHUNK_SIZE`, между порциями управление возвращается
+        в loop. Данные целиком в памяти не собираются.
+
+        Имя файла уникально (время и случайный суффикс), при ошибке
+        администратору отправляется сообщение.
+        """
+
+        started_at = perf_counter()
+
+        (export_path := self.data_path / 'export').mkdir(exist_ok=True)
+        path = export_path / (
+            f'export_{datetime.now():%Y%m%d_%H%M%S}_'
+            f'{secrets.token_hex(const.EXPORT_SUFFIX_BYTES)}.{export_format}'
+        )
+
+        # NB: копия ключей, т.к. словарь может измениться между порциями
+        user_ids = list(self._users)
+        n_records = 0
+
+        try:
+            # NB: режим 'x' - существующий файл не перезаписывается
+            with path.open('x', newline='') as file:
+
+                if export_format == 'csv':
+                    writer = csv.DictWriter(
+                        file,
+                        fieldnames=(
+                            const.EXPORT_CSV_FIELDS
+                            + tuple(field.name for field in fields(UserData))
+                        )
+                    )
+                    writer.writeheader()
+                    write_record = writer.writerow
+                else:
+                    def write_record(record: dict):
+                        file.write(json.dumps(record) + '\n')
+
+                for user_id in user_ids:
+                    for record in self._iter_export_records(user_id):
+                        write_record(record)
+                        n_records += 1
+
+                        if not n_records % const.EXPORT_CHUNK_SIZE:
+                            await asyncio.sleep(0)
+
+        except Exception as exc:
+            await self._send_message(
+                context.sender.get(),
+                const.MSG_EXPORT_FAILED.format(
+                    path=path, error=exc.__class__.__name__
+                )
+            )
+            # Исключение логгируется manage_context
+            raise
+
+        await self._send_message(
+            context.sender.get(),
+            const.MSG_EXPORT_DONE.format(
+                path=path,
+                n_users=len(user_ids),
+                n_records=n_records,
+                size_mb=path.stat().st_size / (1024 ** 2),
+                seconds=perf_counter() - started_at
+            )
+        )
+
+        self.logger.info(
+            f'{context.get_task_prefix()} export to {path} completed: '
+            f'{len(user_ids)} users, {n_records} records'
+        )
+
+    # NB: no @manage_context here - generator
+    def _iter_export_records(self, user_id: int) -> Iterator[dict]:
+        """Итератор записей экспорта для пользователя.
+
+        Записи: данные пользователя (`user`), агрегаты истории (`rollup`),
+        события истории (`event`).
+        """
+
+        if userdata := self._users.get(user_id):
+            yield {'record': 'user', 'user_id': user_id, **asdict(userdata)}
+
+        for resolution, records in self._history.iter_rollups(user_id):
+            for i in range(0, len(records), ROLLUP_RECORD_LEN):
+                yield {
+                    'record': 'rollup',
+                    'user_id': user_id,
+                    'timestamp': records[i],
+                    'kind': const.HISTORY_EVENT_NAMES.get(records[i + 1]),
+                    'count': records[i + 2],
+                    'resolution': resolution,
+                }
+
+        for records in self._history.iter_chunks(user_id):
+            for i in range(0, len(records), RECORD_LEN):
+                yield {
+                    'record': 'event',
+                    'user_id': user_id,
+                    'timestamp': records[i],
+                    'kind': const.HISTORY_EVENT_NAMES.get(records[i + 1]),
+                }
+
+    @manage_context
+    async def _on_command_broadcast(self, text: str | None = None, **kwargs):
+        """Обработчик команды администратора /broadcast.
+
+        Запускает фоновую рассылку текста всем активным пользователям. Без
+        текста - показывает прогресс текущей рассылки или подсказку.
+        """
+
+        # Доступно только администратору бота
+        if context.sender_id.get() not in self._admin_ids:
+            return await self._set_reaction_not_understood()
+
+        if self._broadcast:
+            return await self._send_message(
+                context.sender.get(),
+                (
+                    self._build_broadcast_msg() if not text
+                    else const.MSG_BROADCAST_ALREADY_RUNNING
+                )
+            )
+
+        if not (text := (text or '').strip()):
+            return await self._send_message(
+                context.sender.get(), const.MSG_BROADCAST_USAGE
+            )
+
+        # NB: список получателей фиксируется на момент запуска
+        self._broadcast = {
+            'text': text,
+            'admin_id': context.sender_id.get(),
+            'report_msg_id': None,
+            'user_ids': [
+                user_id for user_id, userdata in self._users.items()
+                if userdata.is_active_user
+            ],
+            'n_done': 0,
+            'n_sent': 0,
+            'n_failed': 0,
+        }
+
+        if report_msg := await self._send_message(
+            context.sender.get(), self._build_broadcast_msg()
+        ):
+            self._broadcast['report_msg_id'] = report_msg.id
+
+        self._save_broadcast()
+        self._loop.create_task(self._broadcast_task())
+
+        self.logger.info(
+            f'{context.get_task_prefix()} /broadcast command handled, '
+            f'{len(self._broadcast["user_ids"])} recipients {const.EMOJI_OK}'
+        )
+
+    @new_context('broadcast')
+    @manage_context
+    async def _broadcast_task(self):
+        """Задача рассылки `self._broadcast` с ограничением скорости.
+
+        Сообщения отправляются не чаще `self._broadcast_rate` в секунду.
+        Прогресс сохраняется в `DATA_PATH/broadcast.yaml` каждые
+        `const.BROADCAST_SAVE_EVERY` сообщений, незавершенная рассылка
+        продолжается после перезапуска бота. Отчет администратору
+        (скорость, оставшееся время) обновляется каждые
+        `const.BROADCAST_REPORT_INTERVAL` секунд.
+        """
+
+        state = self._broadcast
+        started_at = reported_at = self._loop.time()
+        n_done_at_start = state['n_done']
+        send_interval = 1 / self._broadcast_rate
+        next_send_at = started_at
+
+        for user_id in state['user_ids'][n_done_at_start:]:
+
+            if (
+                (userdata := self._users.get(user_id))
+                and userdata.is_active_user
+            ):
+                if (delay := next_send_at - self._loop.time()) > 0:
+                    await asyncio.sleep(delay)
+                next_send_at = (
+                    max(next_send_at, self._loop.time()) + send_interval
+                )
+
+                # Нужен для обработки UserIsBlockedError
+                sender_id_token = context.sender_id.set(user_id)
+
+                if await self._send_message(user_id, state['text']):
+                    state['n_sent'] += 1
+                else:
+                    state['n_failed'] += 1
+
+                context.sender_id.reset(sender_id_token)
+
+            # Пользователь заблокировал бота после запуска рассылки
+            else:
+                state['n_failed'] += 1
+
+            state['n_done'] += 1
+
+            if not state['n_done'] % const.BROADCAST_SAVE_EVERY:
+                self._save_broadcast()
+
+            if (
+                (time_now := self._loop.time()) - reported_at
+                >= const.BROADCAST_REPORT_INTERVAL
+            ):
+                reported_at = time_now
+                await self._edit_broadcast_report(
+                    self._build_broadcast_msg(
+                        rate=(
+                            (state['n_done'] - n_done_at_start)
+                            / (time_now - started_at)
+                        )
+                    )
+                )
+
+        elapsed = self._loop.time() - started_at
+        await self._edit_broadcast_report(
+            self._build_broadcast_msg(
+                rate=(state['n_done'] - n_done_at_start) / elapsed
+                if elapsed else 0,
+                is_done=True
+            )
+        )
+
+        self._broadcast = None
+        (self.data_path / 'broadcast.yaml').unlink(missing_ok=True)
+
+        self.logger.info(
+            f'{context.get_task_prefix()} broadcast completed: '
+            f'{state["n_sent"]} sent, {state["n_failed"]} failed'
+        )
+
+    @manage_context
+    async def _edit_broadcast_report(self, text: str):
+        """Обновить сообщение-отчет о рассылке у администратора."""
+
+        if (report_msg_id := self._broadcast['report_msg_id']) is None:
+            return
+
+        sender_id_token = context.sender_id.set(self._broadcast['admin_id'])
+        await self._edit_message(
+            self._broadcast['admin_id'], report_msg_id, text
+        )
+        context.sender_id.reset(sender_id_token)
+
+    @manage_context
+    def _build_broadcast_msg(
+        self,
+        rate: float = 0,
+        is_done: bool = False
+    ) -> str:
+        """Сформировать отчет о ходе рассылки `self._broadcast`."""
+
+        state = self._broadcast
+        n_total = len(state['user_ids'])
+        n_left = n_total - state['n_done']
+
+        return const.MSG_BROADCAST_PROGRESS.format(
+            state=(
+                const.STR_BROADCAST_DONE if is_done
+                else const.STR_BROADCAST_RUNNING
+            ),
+            n_done=state['n_done'],
+            n_total=n_total,
+            percent=state['n_done'] / n_total if n_total else 1,
+            n_sent=state['n_sent'],
+            n_failed=state['n_failed'],
+            rate=rate,
+            eta=helpers.get_timedelta_string(
+                n_left / (rate or self._broadcast_rate)
+            )
+        )
+
+    @manage_context
+    def _save_broadcast(self):
+        """Сохранение прогресса рассылки."""
+
+        # NB: отложенный импорт - рассылка выполняется редко
+        import yaml
+
+        with open(self.data_path / 'broadcast.yaml', 'w') as file:
+            yaml.safe_dump(self._broadcast, file)
+
+    @manage_context
+    def _resume_broadcast(self):
+        """Продолжить рассылку, прерванную остановкой бота, если она была."""
+
+        if not (filename := (self.data_path / 'broadcast.yaml')).is_file():
+            return
+
+        import yaml
+
+        with filename.open('r') as file:
+            self._broadcast = yaml.safe_load(file)
+
+        self._loop.create_task(self._broadcast_task())
+
+        self.logger.info(
+            f'{context.get_task_prefix()} Broadcast resumed from '
+            f'{self._broadcast["n_done"]} / '
+            f'{len(self._broadcast["user_ids"])}'
+        )
@@ -7,17 +7,31 @@ from logging import Logger
 from telethon import TelegramClient, errors
 from telethon.events.common import EventCommon
 
-from . import context
+from . import context, tracing
+from .clock import Clock
+from .dispatcher import Dispatcher
 
 
 class BaseHandler(ABC):
     """Базовый объект-хендлер для обработки событий Телеграм."""
 
-    def __init__(self, client: TelegramClient, logger: Logger):
+    def __init__(
+        self,
+        client: TelegramClient,
+        logger: Logger,
+        clock: Clock | None = None
+    ):
         self.client = client
         self.logger = logger
         self._loop = client.loop  # just convinience
 
+        # Часы (время и ожидание), подменяются для симуляции
+        self._clock = clock or Clock()
+
+        # Диспетчер обработки событий, если None - каждое событие
+        # обрабатывается независимой задачей
+        self._dispatcher: Dispatcher | None = None
+
     def _log_exception(
         self,
         exc: Exception,
@@ -52,6 +66,10 @@ class BaseHandler(ABC):
 
         Может быть использован как синхронными, так и ассинхронными методами.
 
+        Если у хендлера установлен диспетчер (`self._dispatcher`), задачи
+        обработки событий (`event_handling`) ставятся в очередь пользователя
+        (`sender_id`) диспетчера, иначе сразу создаются в loop.
+
         NB: при использовании нескольких декораторов, должен быть самым
         последним (верхний уровень).
         """
@@ -84,6 +102,7 @@ class BaseHandler(ABC):
                 event_val=(args[0] if event_handling else None),
                 propagate_exc_val=propagate_exc
             )
+            ctx.run(tracing.start_trace, task_name or method.__name__)
             return ctx
 
         def decorator(method):
@@ -108,9 +127,19 @@ class BaseHandler(ABC):
                 self: BaseHandler, *args, **kwargs
             ):
 
+                ctx = build_context_obj(method, self, args, kwargs)
+
+                if event_handling and self._dispatcher:
+                    return await self._dispatcher.submit(
+                        ctx.get(context.sender_id),
+                        functools.partial(method, self, *args, **kwargs),
+                        ctx,
+                        tag=ctx.get(context.query_data)
+                    )
+
                 return self._loop.create_task(
                     method(self, *args, **kwargs),
-                    context=build_context_obj(method, self, args, kwargs)
+                    context=ctx
                 )
 
             return async_new_context_wrapper
@@ -141,9 +170,14 @@ class BaseHandler(ABC):
             указанное число секунд и рекурсивно перевызывает исходный
             (декорированный) метод.
 
+        В трассируемых задачах (см. `tracing`) вызов метода записывается
+        спаном: начало, длительность, результат.
+
         Может быть использован как синхронными, так и ассинхронными методами.
         """
 
+        traced_method = tracing.traced(method)
+
         if not asyncio.iscoroutinefunction(method):
 
             # Sync decorator
@@ -154,7 +188,9 @@ class BaseHandler(ABC):
 
                 try:
                     tokens = context.enter_method(method, args, kwargs)
-                    return method(self, *args, **kwargs)
+                    return (
+                        traced_method if tracing.trace.get() else method
+                    )(self, *args, **kwargs)
 
                 except Exception as exc:
                     self._log_exception(
@@ -176,7 +212,9 @@ class BaseHandler(ABC):
 
             try:
                 tokens = context.enter_method(method, args, kwargs)
-                return await method(self, *args, **kwargs)
+                return await (
+                    traced_method if tracing.trace.get() else method
+                )(self, *args, **kwargs)
 
             # Обработка UserIsBlockedError
             except errors.UserIsBlockedError:
@@ -193,7 +231,7 @@ class BaseHandler(ABC):
                     f'{context.get_log_prefix()} 🟡 got a FloodWaitError, '
                     f'sleeping for {exc.seconds} seconds'
                 )
-                await asyncio.sleep(exc.seconds)
+                await self._clock.sleep(exc.seconds)
 
                 # Рекурсивно перевызываем декорированный метод
                 self.logger.info(
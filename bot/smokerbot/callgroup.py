@@ -0,0 +1,53 @@
+import asyncio
+from collections.abc import Coroutine
+
+
+class CallGroup:
+    """Группа независимых вызовов, выполняемых конкурентно с блоком кода.
+
+    Используется как асинхронный контекстный менеджер:
+
+        async with CallGroup() as calls:
+            calls.start(self._answer_callback_query(event))
+            await self._process(...)
+
+    Вызовы, запущенные методом `start()`, выполняются задачами (в копии
+    текущего контекста), тело блока - в текущем контексте, поэтому
+    значения контекстных переменных, установленные в теле, сохраняются.
+
+    При выходе из блока дожидается завершения всех задач (задачи не
+    переживают блок), в том числе при исключении в теле блока; задачи
+    отменяются только при отмене самого блока. Исключения задач не
+    перевызываются (тело блока уже выполнено, повторять его нельзя), поэтому
+    вызовы должны сами обрабатывать ошибки (методы с `manage_context`).
+
+    NB: порядок выполнения вызовов группы не гарантируется, вызовы, порядок
+    которых важен (например, последовательные сообщения в чат), должны
+    выполняться последовательно.
+    """
+
+    def __init__(self):
+        self._tasks: list[asyncio.Task] = []
+
+    async def __aenter__(self) -> 'CallGroup':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+
+        if exc_type is not None and issubclass(
+            exc_type, asyncio.CancelledError
+        ):
+            for task in self._tasks:
+                task.cancel()
+
+        # NB: исключения задач извлекаются (без "never retrieved"), но не
+        # перевызываются
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def start(self, coro: Coroutine) -> asyncio.Task:
+        """Запустить вызов `coro` конкурентно с телом блока."""
+
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.append(task)
+
+        return task
@@ -0,0 +1,98 @@
+import asyncio
+import heapq
+from array import array
+from itertools import count
+from time import time
+
+
+class Clock:
+    """Часы хендлера: текущее POSIX время и ожидание.
+
+    По умолчанию - системное время и `asyncio.sleep()`. Подменяется
+    (`VirtualClock`) для ускоренной симуляции таймеров.
+    """
+
+    def time(self) -> float:
+        """Текущее время, POSIX."""
+
+        return time()
+
+    async def sleep(self, seconds: float):
+        """Ожидание `seconds` секунд."""
+
+        await asyncio.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """Виртуальные часы для ускоренной симуляции.
+
+    Время не идет само: оно сдвигается методом `advance()`. Задачи,
+    ожидающие в `sleep()`, пробуждаются в порядке времени пробуждения,
+    текущее время при этом равно времени пробуждения.
+
+    Опоздание пробуждения (виртуальное время между плановым пробуждением и
+    фактическим продолжением задачи) накапливается в `self.lateness`, если
+    `track_lateness=True`.
+    """
+
+    def __init__(self, start: float | None = None, track_lateness=False):
+        self._now = time() if start is None else start
+
+        # Ожидающие задачи: куча (время пробуждения, No., future)
+        self._sleepers: list[tuple[float, int, asyncio.Future]] = []
+        self._seq = count()
+
+        self.n_wakeups = 0
+        self.lateness = array('d') if track_lateness else None
+
+    @property
+    def n_sleeping(self) -> int:
+        """Кол-во задач, ожидающих в `sleep()`."""
+
+        return len(self._sleepers)
+
+    def time(self) -> float:
+        return self._now
+
+    async def sleep(self, seconds: float):
+        if seconds <= 0:
+            return await asyncio.sleep(0)
+
+        wake_at = self._now + seconds
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (wake_at, next(self._seq), future))
+
+        await future
+
+        if self.lateness is not None:
+            self.lateness.append(self._now - wake_at)
+
+    async def advance(self, seconds: float, settle: int = 3) -> int:
+        """Сдвинуть время на `seconds` секунд, пробуждая ожидающие задачи.
+
+        После пробуждения очередной группы задач (с одинаковым временем)
+        управление `settle` раз возвращается в loop, чтобы задачи успели
+        выполниться и, при необходимости, снова уснуть.
+
+        Возвращает кол-во пробужденных задач.
+        """
+
+        target = self._now + seconds
+        n_wakeups = 0
+
+        while self._sleepers and self._sleepers[0][0] <= target:
+            self._now = max(self._now, self._sleepers[0][0])
+
+            while self._sleepers and self._sleepers[0][0] <= self._now:
+                _, _, future = heapq.heappop(self._sleepers)
+                if not future.done():
+                    future.set_result(None)
+                    n_wakeups += 1
+
+            for _ in range(settle):
+                await asyncio.sleep(0)
+
+        self._now = target
+        self.n_wakeups += n_wakeups
+
+        return n_wakeups
@@ -19,7 +19,19 @@ USER_DATA_DEFAULT = {
     'sig_available': 0,
     'sig_smoked': 0,
     'timer_start': None,
-    'timer_end': None
+    'timer_end': None,
+
+    'stat_total': 0,
+    'stat_day': None,
+    'stat_day_count': 0,
+    'stat_week': None,
+    'stat_week_count': 0,
+    'stat_last_smoke': None,
+    'stat_n_intervals': 0,
+    'stat_interval_sum': 0.0,
+    'stat_interval_sq_sum': 0.0,
+    'stat_interval_min': None,
+    'stat_interval_max': None
 }
 
 BOT_COMMAND_NAME_RE_DICT = {
@@ -61,10 +73,21 @@ BOT_COMMAND_NAME_RE_DICT = {
     'smoke': re.compile(
         r'(?i)^/(?P<name>smoke)[\s]*$'
     ),
-    # Команда администратора
+    'stats': re.compile(
+        r'(?i)^/(?P<name>stats)[\s]*$'
+    ),
+    # Команды администратора
     'info': re.compile(
         r'(?i)^/(?P<name>info)[\s]*$'
     ),
+    'export': re.compile(
+        r'^/(?i:(?P<name>export))'
+        r'([\s]+(?P<export_format>jsonl|csv))?[\s]*$'
+    ),
+    'broadcast': re.compile(
+        r'^/(?i:(?P<name>broadcast))'
+        r'([\s]+(?P<text>(?s:.+)))?$'
+    ),
 }
 
 # Имена re-групп, содержащих целочисленные значнеия
@@ -77,6 +100,7 @@ BOT_COMMANDS_DEFAULT = [
     BotCommand(command='smoke', description='🚬 Выкурить сигарету'),
     BotCommand(command='stop', description='🛑 Остановить таймер'),
     BotCommand(command='status', description='ℹ️ Текущий статус'),
+    BotCommand(command='stats', description='📊 Статистика'),
     BotCommand(command='settings', description='⚙️ Настройки'),
     BotCommand(command='help', description='🆘 Помощь'),
     BotCommand(command='setinterval', description='🔢⚙️ Установить интервал'),
@@ -118,6 +142,8 @@ MSG_HELP = (
 
     'ℹ️\t/status - текущий статус бота\n\n'
 
+    '📊\t/stats - статистика по выкуренным сигаретам\n\n'
+
     '⚙️\t/settings - показать настройки\n\n'
 
     '🆘\t/help -  показать это сообщение\n\n'
@@ -149,8 +175,16 @@ MSG_SETTINGS = (
 
 MSG_INFO = (
     '🔵 **Статус бота**:\n'
-    '▫ Пользователи: **{n_users}**\n'
+    '▫ Пользователи за день / неделю / месяц: **{n_users_day}** / '
+    '**{n_users_week}** / **{n_users_month}**\n'
+    '▫ Таймеры: запущено **{n_timers_running}**, '
+    'на паузе **{n_timers_paused}**\n'
     '▫ Память: {mem_mb:.0f} Mb\n'
+    '▫ Очередь событий: {n_pending} (в работе {n_running})\n'
+    '▫ Задержка loop: {loop_lag_ms:.0f} ms\n'
+    '▫ Сброшено: {shed_counts}\n'
+    '▫ Повторные обновления: {n_duplicates} ({duplicate_rate:.2%})\n\n'
+    '__Подсчет пользователей: {calc_ms:.3f} ms__\n'
 )
 
 STR_MODE_AUTO = '**авто** __(сразу после окончания интервала)__'
@@ -169,7 +203,101 @@ TZ_OFFSET_MAX = 12
 
 SECONDS_IN_MINUTE = 60
 SECONDS_IN_HOUR = 3600
-SECONDS_IN_WEEK = SECONDS_IN_HOUR * 24 * 7
+SECONDS_IN_DAY = SECONDS_IN_HOUR * 24
+SECONDS_IN_WEEK = SECONDS_IN_DAY * 7
+SECONDS_IN_MONTH = SECONDS_IN_DAY * 30
+
+# Периоды активности пользователей (ActivityIndex), сек
+ACTIVITY_WINDOWS = (SECONDS_IN_DAY, SECONDS_IN_WEEK, SECONDS_IN_MONTH)
+
+# Ограничения диспетчера событий по умолчанию:
+# кол-во одновременно обрабатываемых событий
+DISPATCHER_MAX_CONCURRENCY = 64
+# кол-во принятых, но еще не обработанных событий (backpressure)
+DISPATCHER_MAX_PENDING = 1000
+# длина очереди событий одного пользователя
+DISPATCHER_MAX_USER_PENDING = 10
+
+# Политики сброса нагрузки диспетчера
+SHED_POLICY_DEDUP_CALLBACKS = 'dedup_callbacks'
+SHED_POLICY_SKIP_REACTIONS = 'skip_reactions'
+SHED_POLICY_DEFER_STATUS = 'defer_status'
+SHED_POLICY_DROP_WHEN_FULL = 'drop_when_full'
+
+SHED_POLICIES_DEFAULT = (
+    SHED_POLICY_DEDUP_CALLBACKS,
+    SHED_POLICY_SKIP_REACTIONS,
+    SHED_POLICY_DEFER_STATUS,
+)
+
+# Перегрузка: задержка loop, сек, или доля заполнения входной очереди
+LOOP_LAG_THRESHOLD = 0.5
+LOOP_LAG_CHECK_INTERVAL = 1
+OVERLOAD_PENDING_RATIO = 0.8
+
+# Макс. время ожидания отложенного сообщения со статусом, сек
+STATUS_DEFER_TIMEOUT = 30
+
+# Подавление повторных обновлений: время хранения ключа, сек, и макс. кол-во
+# хранимых ключей
+DEDUP_TTL = 3600
+DEDUP_MAX_SIZE = 10_000
+
+# Очередь исходящих уведомлений: интервал сброса журнала на диск и повторных
+# отправок, сек, макс. кол-во несохраненных строк журнала, кол-во попыток
+# отправки, начальная задержка повтора (удваивается с каждой попыткой), сек,
+# и макс. время хранения уведомления, сек
+OUTBOX_SYNC_INTERVAL = 1
+OUTBOX_SYNC_EVERY = 100
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = 30
+OUTBOX_MAX_AGE = SECONDS_IN_DAY
+
+# Трассировка: доля трассируемых задач (0 - выключена) и файл спанов (JSONL)
+TRACE_SAMPLE_RATE = 0
+TRACE_PATH = 'logs/traces.jsonl'
+
+# История событий пользователя: типы событий
+HISTORY_EVENT_SMOKE = 0
+HISTORY_EVENT_RUN = 1
+HISTORY_EVENT_STOP = 2
+HISTORY_EVENT_WAKEUP = 3
+
+HISTORY_EVENT_NAMES = {
+    HISTORY_EVENT_SMOKE: 'smoke',
+    HISTORY_EVENT_RUN: 'run',
+    HISTORY_EVENT_STOP: 'stop',
+    HISTORY_EVENT_WAKEUP: 'wakeup',
+}
+
+# Кол-во записей в одном файле-чанке истории
+HISTORY_CHUNK_SIZE = 4096
+
+# Хранение сырой истории по умолчанию, дней (0 - без ограничения);
+# более старые записи сжимаются в агрегаты за час или день
+HISTORY_RETENTION_DAYS = 90
+HISTORY_ROLLUP_RESOLUTIONS = {'hour': 3600, 'day': 86400}
+HISTORY_ROLLUP_DEFAULT = 'day'
+
+# Период проверки истории и кол-во пользователей, обрабатываемых за один
+# шаг (шаг выполняется в отдельном потоке)
+HISTORY_RETENTION_CHECK_INTERVAL = 3600
+HISTORY_RETENTION_SLICE = 20
+
+# Статистика: глубина по дням и границы корзин гистограммы интервалов
+# (в долях установленного интервала)
+STATS_DAYS = 7
+STATS_HIST_BINS = (0, 0.5, 0.75, 1, 1.5, 2, float('inf'))
+STATS_BAR_LENGTH = 10
+
+# Размер кэша строк времени окончания таймеров (~ кол-во активных таймеров)
+TIME_STRING_CACHE_SIZE = 4096
+
+# Реализации event loop и реализация по умолчанию
+EVENT_LOOP_ASYNCIO = 'asyncio'
+EVENT_LOOP_UVLOOP = 'uvloop'
+EVENT_LOOP_IMPLEMENTATIONS = (EVENT_LOOP_ASYNCIO, EVENT_LOOP_UVLOOP)
+EVENT_LOOP_DEFAULT = EVENT_LOOP_ASYNCIO
 
 MSG_STATUS_RUNNING = (
     'ℹ️ Таймер **запущен** ✔️\n\n'
@@ -190,6 +318,8 @@ MSG_STATUS_STOPPED = 'ℹ️ Таймер **остановлен** 🛑\n'
 
 MSG_RUN_ALREADY_RUNNING = 'Сервис __**уже**__ запущен ❇'
 
+MSG_CALLBACK_BUSY = '⏳ Бот перегружен, попробуйте позже'
+
 MSG_ERROR_CHECK_SETTINGS = (
     '⚠️ Внутренняя ошибка, таймер остановлен\nПроверьте настройки!'
 )
@@ -211,6 +341,43 @@ MSG_SMOKE_NEGATIVE_NO_SIG_AVAILABLE = (
 
 MSG_SMOKE_AFFIRMATIVE = '🚬 выкурена 🆗\n'
 
+MSG_STATS_NO_DATA = '📊 Статистики пока нет: выкуренных 🚬 не найдено'
+
+MSG_STATS = (
+    '📊 **Статистика**\n\n'
+    'Выкурено 🚬 сегодня: **{today_count}**, за неделю: **{week_count}**, '
+    'всего: **{total}**\n'
+    'В среднем за день: **{avg_per_day:.1f}** {trend} '
+    '__(неделей ранее {avg_per_day_prev:.1f})__\n\n'
+    '__**По дням:**__\n{days}\n\n'
+    '__**Интервалы между 🚬**__ (установлен **{interval}** мин):\n'
+    '{intervals}\n\n'
+    '🏅 Дней подряд без коротких интервалов: **{streak}** '
+    '__(лучшая серия {best_streak})__\n'
+)
+
+MSG_STATS_INTERVALS = (
+    '▫ Среднее: **{mean_interval}** ± {std_interval}\n'
+    '▫ Мин: {min_interval}, макс: {max_interval}'
+    '{details}'
+)
+
+# Детали интервалов - только по несжатой истории
+MSG_STATS_INTERVALS_DETAILS = (
+    '\n▫ Медиана: **{median_interval}**\n'
+    '▫ Не короче установленного: **{share_ok:.0%}**\n'
+    '{histogram}'
+)
+
+MSG_STATS_NO_INTERVALS = '▫ Пока нет данных'
+
+STR_STATS_DAY = '▫ {date}: **{count}** {bar}'
+STR_STATS_HIST_BIN = '▫ {label} мин: **{count}** {bar}'
+STR_STATS_BAR = '▮'
+STR_TREND_UP = '⬆️'
+STR_TREND_DOWN = '⬇️'
+STR_TREND_FLAT = '➡️'
+
 CALLBACK_BTN_TEXT_UPDATE = 'Обновить'
 CALLBACK_BTN_TEXT_MINUS_10 = '-10'
 CALLBACK_BTN_TEXT_MINUS_1 = '-1'
@@ -226,6 +393,9 @@ CALLBACK_COMMAND_SETMODE = 'setmode {action} {mode}'
 CALLBACK_COMMAND_SETINITIAL = 'setinitial {action} {initial_sig}'
 CALLBACK_COMMAND_SETTZ = 'settz {action} {tz_offset}'
 
+# Данные callback-запросов, повторы которых в очереди отбрасываются
+SHED_DEDUP_CALLBACKS = (CALLBACK_COMMAND_STATUS_UPDATE.encode('utf-8'),)
+
 BOT_CALLBACK_COMMANDS_RE = (
     # <cкомпилированные regex>
     re.compile(
@@ -277,3 +447,50 @@ MSG_SETTZ = (
 )
 
 MSG_ADMIN_ON_INIT = '🔵 The bot service is being started'
+
+# Экспорт данных: формат по умолчанию, кол-во записей между передачей
+# управления в loop
+EXPORT_FORMAT_DEFAULT = 'jsonl'
+EXPORT_CHUNK_SIZE = 1000
+# Длина случайного суффикса имени файла экспорта, байт
+EXPORT_SUFFIX_BYTES = 3
+
+# Колонки CSV экспорта (+ поля UserData)
+EXPORT_CSV_FIELDS = (
+    'record', 'user_id', 'timestamp', 'kind', 'count', 'resolution'
+)
+
+# Рассылка: скорость по умолчанию, сообщений/сек, период сохранения
+# прогресса (кол-во сообщений) и обновления отчета, сек
+BROADCAST_RATE = 10
+BROADCAST_SAVE_EVERY = 20
+BROADCAST_REPORT_INTERVAL = 15
+
+MSG_BROADCAST_USAGE = (
+    '📣 Рассылка всем активным пользователям:\n`/broadcast <текст>`'
+)
+
+MSG_BROADCAST_ALREADY_RUNNING = '📣 Рассылка __**уже**__ выполняется'
+
+MSG_BROADCAST_PROGRESS = (
+    '📣 **Рассылка** {state}\n'
+    '▫ Обработано: **{n_done}** / {n_total} ({percent:.0%})\n'
+    '▫ Отправлено: **{n_sent}**, ошибок: **{n_failed}**\n'
+    '▫ Скорость: {rate:.1f} msg/s\n'
+    '▫ Осталось: ~{eta}\n'
+)
+
+STR_BROADCAST_RUNNING = 'выполняется ⏳'
+STR_BROADCAST_DONE = 'завершена ✔️'
+
+MSG_EXPORT_STARTED = '📦 Экспорт данных ({export_format}) запущен...'
+
+MSG_EXPORT_FAILED = '⚠️ Ошибка экспорта в `{path}`: {error}'
+
+MSG_EXPORT_DONE = (
+    '📦 Экспорт завершен: `{path}`\n'
+    '▫ Пользователи: **{n_users}**\n'
+    '▫ Записей: **{n_records}**\n'
+    '▫ Размер: **{size_mb:.2f}** Mb\n'
+    '▫ Время: {seconds:.1f} s\n'
+)
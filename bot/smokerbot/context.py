@@ -41,8 +41,10 @@ sender_id: ContextVar[int | None] = (
     # in practice should always be present in event
     ContextVar('sender_id', default=None)
 )
-sender: ContextVar[types.User | types.Channel | None] = (
-    # might be missing in event
+sender: ContextVar[
+    types.User | types.Channel | types.InputPeerUser | None
+] = (
+    # might be missing in event, InputPeerUser in timer wakeup contexts
     ContextVar('sender', default=None)
 )
 
@@ -53,6 +55,12 @@ query: ContextVar[types.UpdateBotCallbackQuery | None] = (
 query_id: ContextVar[int | None] = ContextVar('query_id', default=None)
 query_data: ContextVar[bytes | None] = ContextVar('query_data', default=None)
 
+# Request-scoped memo of sender's data: (user_id, UserData), set on first
+# lookup by UserdataMixin._get_or_create_userdata()
+userdata: ContextVar[tuple[int, object] | None] = (
+    ContextVar('userdata', default=None)
+)
+
 
 def print_vars(prefix='', names=()):
     """Debug only!"""
@@ -68,15 +76,15 @@ def init_contextvars(
         event_val: EventCommon | None = None,
         propagate_exc_val: bool | None = None,
         sender_id_val: int | None = None,
-        sender_val: types.User | None = None
+        sender_val: types.User | types.InputPeerUser | None = None
 ):
     """Set contextvars based on given args."""
 
     # Устанавливаем контекст обработки события telethon, при наличии
     if isinstance(event_val, EventCommon):
 
-        # Обработка общих аттрибутов событий telethon event
-        # https://docs.telethon.dev/en/stable/quick-references/events-reference.html#events-reference
+        # Обработка общих аттрибутов событий telethon event, см.
+        # docs.telethon.dev/en/stable/quick-references/events-reference.html
         for var_name in ('chat_id', 'chat', 'sender_id', 'sender'):
             globals()[var_name].set(getattr(event_val, var_name, None))
 
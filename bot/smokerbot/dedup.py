@@ -0,0 +1,61 @@
+from collections import OrderedDict
+from collections.abc import Hashable
+
+from .clock import Clock
+
+
+class SeenSet:
+    """Ограниченное множество недавно полученных ключей с истечением.
+
+    Используется для подавления повторно доставленных обновлений: ключ
+    считается повтором, если он был добавлен не более `ttl` секунд назад.
+    Хранится не более `max_size` ключей, при переполнении вытесняются самые
+    старые.
+
+    Ключи хранятся в порядке добавления (время добавления не убывает),
+    поэтому истекшие ключи удаляются с начала, амортизированно O(1) на
+    проверку.
+    """
+
+    def __init__(self, ttl: float, max_size: int, clock: Clock | None = None):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._clock = clock or Clock()
+
+        # {ключ: время истечения}
+        self._seen: OrderedDict[Hashable, float] = OrderedDict()
+
+        self.n_checks = 0
+        self.n_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    @property
+    def hit_rate(self) -> float:
+        """Доля проверок, обнаруживших повтор."""
+
+        return self.n_hits / self.n_checks if self.n_checks else 0.
+
+    def check_and_add(self, key: Hashable) -> bool:
+        """Проверить, был ли ключ получен ранее, и запомнить его.
+
+        Возвращает `True`, если ключ - повтор (срок не истек).
+        """
+
+        time_now = self._clock.time()
+        self.n_checks += 1
+
+        # Удаляем истекшие ключи
+        while self._seen and next(iter(self._seen.values())) <= time_now:
+            self._seen.popitem(last=False)
+
+        if key in self._seen:
+            self.n_hits += 1
+            return True
+
+        self._seen[key] = time_now + self._ttl
+        if len(self._seen) > self._max_size:
+            self._seen.popitem(last=False)
+
+        return False
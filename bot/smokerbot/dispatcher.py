@@ -0,0 +1,257 @@
+import asyncio
+from collections import Counter, deque
+from collections.abc import Callable, Coroutine, Iterable
+from contextvars import Context
+from itertools import islice
+from logging import Logger
+
+from . import const
+
+
+class Dispatcher:
+    """Диспетчер обработки событий (ограниченная входная очередь).
+
+    Каждому пользователю соответствует своя FIFO очередь: события одного
+    пользователя обрабатываются строго последовательно, события разных
+    пользователей - параллельно.
+
+    Ограничения:
+        - `max_concurrency` - максимальное кол-во одновременно выполняемых
+        обработчиков (для всех пользователей)
+        - `max_pending` - максимальное кол-во принятых, но еще не обработанных
+        событий; при достижении лимита `submit()` ожидает освобождения места
+        (backpressure), либо отбрасывает событие (политика `drop_when_full`)
+        - `max_user_pending` - максимальная длина очереди пользователя,
+        события сверх лимита отбрасываются
+
+    Политики сброса нагрузки (`shed_policies`, см. `const.SHED_POLICY_*`):
+        - `dedup_callbacks` - не ставить в очередь повторный callback-запрос
+        (из `const.SHED_DEDUP_CALLBACKS`), если такой же уже ожидает обработки
+        - `skip_reactions` - при перегрузке не ставить реакции на сообщения
+        - `defer_status` - при перегрузке откладывать необязательные
+        сообщения со статусом
+        - `drop_when_full` - при заполненной очереди отбрасывать события
+        вместо ожидания
+
+    Перегрузка: задержка loop больше `const.LOOP_LAG_THRESHOLD` или кол-во
+    ожидающих событий больше `const.OVERLOAD_PENDING_RATIO` от `max_pending`.
+
+    Счетчики сброшенных событий/действий - `shed_counts`. Для отброшенного
+    события вызывается `on_drop(ctx, reason)` (например, чтобы ответить на
+    callback-запрос).
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        logger: Logger,
+        max_concurrency: int,
+        max_pending: int,
+        max_user_pending: int,
+        shed_policies: Iterable[str] = (),
+        on_drop: Callable[[Context, str], None] | None = None
+    ):
+        self._loop = loop
+        self._logger = logger
+        self._max_pending = max_pending
+        self._max_user_pending = max_user_pending
+        self._policies = frozenset(shed_policies)
+        self._on_drop = on_drop
+
+        self._concurrency = asyncio.Semaphore(max_concurrency)
+        self._pending = asyncio.Semaphore(max_pending)
+
+        # Очереди пользователей {key: deque[(coro_factory, ctx, future, tag)]}
+        self._queues: dict[int, deque] = {}
+
+        # Счетчики
+        self.n_pending = 0
+        self.n_running = 0
+        self.shed_counts = Counter()
+
+        # Текущая задержка loop, сек
+        self.loop_lag = 0.0
+
+    @property
+    def n_queues(self) -> int:
+        """Кол-во пользователей с непустой очередью."""
+
+        return len(self._queues)
+
+    @property
+    def is_overloaded(self) -> bool:
+        """Признак перегрузки."""
+
+        return (
+            self.loop_lag > const.LOOP_LAG_THRESHOLD
+            or self.n_pending
+            > self._max_pending * const.OVERLOAD_PENDING_RATIO
+        )
+
+    def shed(self, policy: str) -> bool:
+        """Проверить, нужно ли сбросить действие согласно политике `policy`.
+
+        Возвращает `True` (и увеличивает счетчик), если политика включена и
+        диспетчер перегружен.
+        """
+
+        if policy in self._policies and self.is_overloaded:
+            self.count_shed(policy)
+            return True
+
+        return False
+
+    def count_shed(self, reason: str):
+        """Учесть сброшенное событие/действие с причиной `reason`."""
+
+        self.shed_counts[reason] += 1
+
+    async def submit(
+        self,
+        key: int,
+        coro_factory: Callable[[], Coroutine],
+        ctx: Context,
+        tag: bytes | None = None
+    ) -> asyncio.Future | None:
+        """Поставить обработку события в очередь пользователя `key`.
+
+        Корутина создается вызовом `coro_factory()` непосредственно перед
+        запуском и выполняется отдельной задачей в контексте `ctx`.
+        Необязательный `tag` (данные callback-запроса) используется для
+        поиска дубликатов.
+
+        Возвращает `asyncio.Future` с результатом обработки, либо `None`, если
+        событие было отброшено.
+        """
+
+        if reason := self._get_drop_reason(key, tag):
+            return self._drop(key, ctx, reason)
+
+        if self._pending.locked():
+            if const.SHED_POLICY_DROP_WHEN_FULL in self._policies:
+                return self._drop(
+                    key, ctx, const.SHED_POLICY_DROP_WHEN_FULL
+                )
+
+            self._logger.debug(
+                f'[ dispatcher ]: intake queue is full, key={key} is waiting'
+            )
+
+        # Backpressure: ждем, пока освободится место
+        await self._pending.acquire()
+
+        # NB: за время ожидания очередь пользователя могла пополниться
+        if reason := self._get_drop_reason(key, tag):
+            self._pending.release()
+            return self._drop(key, ctx, reason)
+
+        self.n_pending += 1
+
+        future = self._loop.create_future()
+
+        if (queue := self._queues.get(key)) is None:
+            queue = self._queues[key] = deque()
+            queue.append((coro_factory, ctx, future, tag))
+            # Обработчик очереди выполняется в собственном (пустом) контексте
+            self._loop.create_task(
+                self._worker(key, queue),
+                name=f'dispatcher @ {key}',
+                context=Context()
+            )
+        else:
+            queue.append((coro_factory, ctx, future, tag))
+
+        return future
+
+    async def wait_not_overloaded(self, timeout: float) -> bool:
+        """Ожидать окончания перегрузки не более `timeout` секунд.
+
+        Возвращает `True`, если перегрузка закончилась, иначе `False`.
+        """
+
+        deadline = self._loop.time() + timeout
+
+        while self.is_overloaded:
+            if self._loop.time() > deadline:
+                return False
+            await asyncio.sleep(const.LOOP_LAG_CHECK_INTERVAL)
+
+        return True
+
+    async def monitor_loop_lag(self):
+        """Задача периодического измерения задержки loop."""
+
+        while True:
+            started_at = self._loop.time()
+            await asyncio.sleep(const.LOOP_LAG_CHECK_INTERVAL)
+            self.loop_lag = max(
+                self._loop.time() - started_at - const.LOOP_LAG_CHECK_INTERVAL,
+                0.0
+            )
+
+    def _get_drop_reason(self, key: int, tag: bytes | None) -> str | None:
+        """Причина отбросить событие для очереди `key`, `None` - принять."""
+
+        queue = self._queues.get(key, ())
+
+        if len(queue) >= self._max_user_pending:
+            return 'user_queue_full'
+
+        if (
+            tag in const.SHED_DEDUP_CALLBACKS
+            and const.SHED_POLICY_DEDUP_CALLBACKS in self._policies
+            # NB: queue[0] уже выполняется, сравниваются только ожидающие
+            and any(item[3] == tag for item in islice(queue, 1, None))
+        ):
+            return const.SHED_POLICY_DEDUP_CALLBACKS
+
+        return None
+
+    def _drop(self, key: int, ctx: Context, reason: str) -> None:
+        """Отбросить событие, увеличить счетчик, вызвать `on_drop`."""
+
+        self.count_shed(reason)
+        self._logger.warning(
+            f'[ dispatcher ]: event for key={key} dropped: {reason}'
+        )
+
+        if self._on_drop:
+            self._on_drop(ctx, reason)
+
+    async def _worker(self, key: int, queue: deque):
+        """Последовательная обработка очереди пользователя `key`."""
+
+        try:
+            while queue:
+                coro_factory, ctx, future, _ = queue[0]
+
+                try:
+                    async with self._concurrency:
+                        self.n_running += 1
+                        try:
+                            result = await self._loop.create_task(
+                                coro_factory(), context=ctx
+                            )
+                        finally:
+                            self.n_running -= 1
+
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+
+                except Exception as exc:
+                    future.done() or future.set_exception(exc)
+                    # Исключение обработчика уже залоггировано manage_context
+                    future.exception()
+
+                else:
+                    future.done() or future.set_result(result)
+
+                finally:
+                    queue.popleft()
+                    self.n_pending -= 1
+                    self._pending.release()
+
+        finally:
+            # NB: между проверкой `while queue` и удалением нет await
+            self._queues.pop(key, None)
@@ -0,0 +1,52 @@
+import asyncio
+import importlib.util
+from logging import Logger
+
+from . import const
+
+
+def new_event_loop(
+    logger: Logger,
+    implementation: str = const.EVENT_LOOP_DEFAULT,
+    eager_tasks: bool = False
+) -> asyncio.AbstractEventLoop:
+    """Создать и установить текущим event loop заданной реализации.
+
+    - `implementation` - `asyncio` (стандартный) или `uvloop` (если пакет
+    не установлен - стандартный, с предупреждением)
+    - `eager_tasks` - фабрика задач `asyncio.eager_task_factory`: задача
+    выполняется синхронно до первого `await`, завершившиеся без ожидания
+    обработчики не планируются в loop (Python 3.12+, иначе - обычные
+    задачи, с предупреждением)
+    """
+
+    if implementation not in const.EVENT_LOOP_IMPLEMENTATIONS:
+        raise ValueError(
+            f'unknown event loop implementation \'{implementation}\', '
+            f'expected one of {const.EVENT_LOOP_IMPLEMENTATIONS}'
+        )
+
+    if (
+        implementation == const.EVENT_LOOP_UVLOOP
+        and not importlib.util.find_spec('uvloop')
+    ):
+        logger.warning('uvloop is not installed, using asyncio event loop')
+        implementation = const.EVENT_LOOP_ASYNCIO
+
+    if implementation == const.EVENT_LOOP_UVLOOP:
+        import uvloop
+        loop = uvloop.new_event_loop()
+    else:
+        loop = asyncio.new_event_loop()
+
+    if eager_tasks:
+        if task_factory := getattr(asyncio, 'eager_task_factory', None):
+            loop.set_task_factory(task_factory)
+        else:
+            logger.warning(
+                'eager task factory requires Python 3.12+, using default'
+            )
+
+    asyncio.set_event_loop(loop)
+
+    return loop
@@ -0,0 +1,267 @@
+import asyncio
+import datetime as dt
+import random
+from collections import Counter
+from itertools import count
+
+from telethon import errors, events, types
+from telethon.tl.custom import Message
+
+from .clock import Clock
+
+# Внедряемые ошибки и методы клиента, при вызове которых они возможны
+FAULT_FLOOD_WAIT = 'flood_wait'
+FAULT_BLOCKED = 'blocked'
+FAULT_NOT_MODIFIED = 'not_modified'
+FAULT_DISCONNECT = 'disconnect'
+
+FAULT_METHODS = {
+    FAULT_FLOOD_WAIT: (
+        'send_message', 'edit_message', 'delete_messages', '__call__'
+    ),
+    FAULT_BLOCKED: ('send_message', 'edit_message'),
+    FAULT_NOT_MODIFIED: ('edit_message',),
+    FAULT_DISCONNECT: (
+        'get_entity', 'send_message', 'edit_message', 'delete_messages',
+        'send_read_acknowledge', '__call__'
+    ),
+}
+
+# Максимальное время FloodWaitError и длительность разрыва соединения, сек
+FAULT_FLOOD_WAIT_MAX = 30
+FAULT_DISCONNECT_SECONDS = 60
+
+# Размер миниатюры фото профиля пользователя (`stripped_thumb`), байт
+FAKE_USER_THUMB_SIZE = 200
+
+
+class FakeTelegramClient:
+    """Локальная замена `telethon.TelegramClient` для бенчмарков.
+
+    Реализует только методы, используемые хендлером (`send_message`,
+    `edit_message`, `get_entity` и т.п.), без обращения к сети: вызовы
+    записываются в список `self.calls` в виде кортежей `(method, args)`
+    (если `record_calls=True`) и подсчитываются в `self.n_calls`.
+
+    Обработчики регистрируются как у настоящего клиента
+    (`add_event_handler()`), синтетические события `NewMessage` и
+    `CallbackQuery` создаются методами `new_message()` и `callback_query()`
+    и передаются обработчикам методом `dispatch()`.
+
+    Для soak-тестов в вызовы могут внедряться задержка (`latency`, до
+    указанного кол-ва секунд реального времени) и ошибки с заданной
+    вероятностью на вызов (`fault_rates`, `{FAULT_*: вероятность}`):
+    `FloodWaitError`, `UserIsBlockedError`, `MessageNotModifiedError` и
+    разрыв соединения на `FAULT_DISCONNECT_SECONDS` секунд (по часам
+    `clock`), в течение которого вызовы завершаются `ConnectionError`.
+    Кол-во внедренных ошибок - в `self.n_faults`.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop | None = None,
+        record_calls: bool = True,
+        latency: float = 0,
+        fault_rates: dict[str, float] | None = None,
+        clock: Clock | None = None,
+        seed: int | None = None
+    ):
+        self.loop = loop or asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        self.calls: list[tuple[str, tuple]] = []
+        self.n_calls: Counter[str] = Counter()
+        self._record_calls = record_calls
+
+        # Внедрение задержки и ошибок
+        self.n_faults: Counter[str] = Counter()
+        self.latency = latency
+        self.fault_rates = fault_rates or {}
+        self._clock = clock or Clock()
+        self._rng = random.Random(seed)
+        self._disconnected_until = 0.
+
+        # Зарегистрированные обработчики [(callback, event_builder)]
+        self._event_handlers = []
+
+        # Используются событиями telethon при `_set_client()`
+        self._mb_entity_cache = {}
+        self._self_id = 1
+
+        self._msg_ids = count(1)
+
+    def is_connected(self) -> bool:
+        return self._clock.time() >= self._disconnected_until
+
+    async def get_me(self, input_peer: bool = False):
+        return types.InputPeerUser(self._self_id, 0)
+
+    async def get_entity(self, entity):
+        await self._call('get_entity', (entity,))
+        return self.make_user(self._get_id(entity))
+
+    async def send_message(self, entity, message='', **kwargs):
+        await self._call('send_message', (entity, message))
+        return types.Message(
+            id=next(self._msg_ids),
+            peer_id=types.PeerUser(self._get_id(entity)),
+            date=dt.datetime.now(),
+            message=message
+        )
+
+    async def edit_message(self, entity, message=None, text=None, **kwargs):
+        await self._call('edit_message', (entity, message, text))
+
+    async def delete_messages(self, entity, message_ids, **kwargs):
+        await self._call('delete_messages', (entity, message_ids))
+
+    async def send_read_acknowledge(self, entity, *args, **kwargs):
+        await self._call('send_read_acknowledge', (entity,))
+
+    async def __call__(self, request, ordered: bool = False):
+        await self._call('__call__', (request,))
+        return True
+
+    def add_event_handler(self, callback, event: events.common.EventBuilder):
+        self._event_handlers.append((callback, event))
+
+    async def dispatch(self, event: events.common.EventCommon) -> list:
+        """Передать событие подходящим обработчикам (последовательно).
+
+        Возвращает список результатов вызова обработчиков.
+        """
+
+        return [
+            await callback(event)
+            for callback, builder in self._event_handlers
+            if isinstance(event, builder.Event)
+            and (not builder.func or builder.func(event))
+        ]
+
+    def new_message(
+        self,
+        user_id: int,
+        text: str,
+        is_private: bool = True
+    ) -> events.NewMessage.Event:
+        """Создать событие нового входящего сообщения от пользователя."""
+
+        msg = types.Message(
+            id=next(self._msg_ids),
+            peer_id=(
+                types.PeerUser(user_id) if is_private
+                else types.PeerChat(user_id)
+            ),
+            from_id=None if is_private else types.PeerUser(user_id),
+            date=dt.datetime.now(),
+            message=text
+        )
+        msg.__class__ = Message
+
+        return self._set_event_client(
+            events.NewMessage.Event(msg), user_id
+        )
+
+    def callback_query(
+        self,
+        user_id: int,
+        data: str,
+        msg_id: int = 1
+    ) -> events.CallbackQuery.Event:
+        """Создать событие callback-запроса от пользователя."""
+
+        query = types.UpdateBotCallbackQuery(
+            query_id=next(self._msg_ids),
+            user_id=user_id,
+            peer=types.PeerUser(user_id),
+            msg_id=msg_id,
+            chat_instance=0,
+            data=data.encode('utf-8')
+        )
+
+        return self._set_event_client(
+            events.CallbackQuery.Event(
+                query, types.PeerUser(user_id), msg_id
+            ),
+            user_id
+        )
+
+    @staticmethod
+    def make_user(user_id: int) -> types.User:
+        """Создать объект пользователя Telegram для `user_id`.
+
+        Набор полей - как у пользователя из обновлений Telegram (фото
+        профиля с миниатюрой, статус и т.п.).
+        """
+
+        return types.User(
+            id=user_id,
+            access_hash=user_id,
+            first_name=f'user{user_id}',
+            last_name=f'last{user_id}',
+            username=f'user{user_id}',
+            photo=types.UserProfilePhoto(
+                photo_id=user_id,
+                dc_id=2,
+                stripped_thumb=bytes(FAKE_USER_THUMB_SIZE)
+            ),
+            status=types.UserStatusRecently(),
+            lang_code='en'
+        )
+
+    async def _call(self, method: str, args: tuple):
+        """Записать вызов метода клиента, внедрить задержку и ошибки."""
+
+        self.n_calls[method] += 1
+        if self._record_calls:
+            self.calls.append((method, args))
+
+        if self.latency:
+            await asyncio.sleep(self._rng.uniform(0, self.latency))
+
+        if not self.is_connected():
+            raise ConnectionError('fake client is disconnected')
+
+        for fault, rate in self.fault_rates.items():
+            if (
+                method in FAULT_METHODS[fault]
+                and self._rng.random() < rate
+            ):
+                self.n_faults[fault] += 1
+                raise self._get_fault_exc(fault)
+
+    def _get_fault_exc(self, fault: str) -> Exception:
+        """Получить исключение для внедряемой ошибки `fault`."""
+
+        if fault == FAULT_FLOOD_WAIT:
+            return errors.FloodWaitError(
+                None, capture=self._rng.randint(1, FAULT_FLOOD_WAIT_MAX)
+            )
+
+        if fault == FAULT_BLOCKED:
+            return errors.UserIsBlockedError(None)
+
+        if fault == FAULT_NOT_MODIFIED:
+            return errors.MessageNotModifiedError(None)
+
+        self._disconnected_until = (
+            self._clock.time() + FAULT_DISCONNECT_SECONDS
+        )
+        return ConnectionError('fake client is disconnected')
+
+    def _set_event_client(self, event, user_id: int):
+        """Установить сущности и клиент события."""
+
+        event._entities = {user_id: self.make_user(user_id)}
+        event._set_client(self)
+
+        return event
+
+    @staticmethod
+    def _get_id(entity) -> int:
+        """Получить id из entity (`int` или объект telethon)."""
+
+        return (
+            entity if isinstance(entity, int)
+            else getattr(entity, 'id', None) or entity.user_id
+        )
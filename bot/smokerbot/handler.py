@@ -1,20 +1,28 @@
 import asyncio
+import hashlib
 from contextvars import Context, copy_context
-from logging import Logger
+from logging import DEBUG, Logger
 from pathlib import Path
-from time import time
+from time import perf_counter
 
-import psutil
 from telethon import TelegramClient, events, functions, types
 
 from . import const, context, helpers
+from .activity import ActivityIndex
+from .adminmixin import AdminMixin
 from .basehandler import BaseHandler
+from .callgroup import CallGroup
 from .clientmixin import ClientMixin
+from .clock import Clock
+from .dedup import SeenSet
+from .dispatcher import Dispatcher
 from .exceptions import ContextValuetError, InitError
+from .history import EventHistory
+from .outbox import Outbox, OutboxEntry
 from .userdatamixin import UserdataMixin
 
 
-class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
+class SmokerBotHandler(AdminMixin, UserdataMixin, ClientMixin, BaseHandler):
     """Основой объект-хендлер бота."""
 
     new_context = BaseHandler.new_context
@@ -28,17 +36,69 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
             logger: Logger,
             data_path: Path,
             admin_ids: list[int] = [],
-            persistence_interval: int = None
+            persistence_interval: int = None,
+            max_concurrency: int = const.DISPATCHER_MAX_CONCURRENCY,
+            max_pending: int = const.DISPATCHER_MAX_PENDING,
+            max_user_pending: int = const.DISPATCHER_MAX_USER_PENDING,
+            shed_policies: tuple[str] = const.SHED_POLICIES_DEFAULT,
+            history_retention_days: int = const.HISTORY_RETENTION_DAYS,
+            history_rollup: str = const.HISTORY_ROLLUP_DEFAULT,
+            broadcast_rate: float = const.BROADCAST_RATE,
+            clock: Clock | None = None
     ):
         # Инициализация базовых аттрибутов
-        super().__init__(client, logger)
+        super().__init__(client, logger, clock)
         self.data_path = data_path
         self._admin_ids = admin_ids
         self._persistence_interval = persistence_interval
+        self._history_retention_days = history_retention_days
+        self._history_rollup_resolution = (
+            const.HISTORY_ROLLUP_RESOLUTIONS[history_rollup]
+        )
+
+        # Диспетчер: очередь событий на пользователя + общий лимит задач
+        self._dispatcher = Dispatcher(
+            self._loop,
+            self.logger,
+            max_concurrency=max_concurrency,
+            max_pending=max_pending,
+            max_user_pending=max_user_pending,
+            shed_policies=shed_policies,
+            on_drop=self._on_event_dropped
+        )
+        # Задача контроля задержки loop, отложенные сообщения со статусом
+        # (не более одного на пользователя) {user_id: Task}
+        self._loop_lag_task = None
+        self._deferred_status_tasks: dict[int, asyncio.Task] = {}
 
         # Собственный  user_id
         self._self_id = None
 
+        # История событий пользователей
+        self._history = EventHistory(data_path / 'history')
+
+        # Индекс активности пользователей и таймеров
+        self._activity = ActivityIndex()
+
+        # Очередь исходящих уведомлений (журнал в DATA_PATH), задача
+        # повторных отправок и отложенный сброс журнала на диск
+        self._outbox = Outbox(data_path / 'outbox.jsonl', self._clock)
+        self._outbox_retry_task = None
+        self._outbox_flush_handle = None
+
+        # Недавно полученные обновления, для подавления повторов
+        self._seen_updates = SeenSet(
+            const.DEDUP_TTL, const.DEDUP_MAX_SIZE, self._clock
+        )
+
+        # Состояние текущей рассылки (см. AdminMixin), сообщений/сек
+        self._broadcast = None
+        self._broadcast_rate = broadcast_rate
+
+        # Кэш сообщений со статистикой, сбрасывается при новом событии
+        # {user_id: (cache_key, message)}
+        self._stats_cache = {}
+
         # MVP: пользовательские данные словарь
         # {iser_id: UserData_obj}
         self._users = {k: self._get_default_userdata() for k in admin_ids}
@@ -54,31 +114,40 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
         if not self.client.is_connected():
             raise InitError('telethon client is not yet connected')
 
-        # Получаем собственный user_id
-        self._self_id = (
-            self._loop.run_until_complete(
-                self.client.get_me(input_peer=True)
-            ).user_id
-        )
-
-        # Установка команд и кнопки меню бота
-        self._loop.run_until_complete(
-            self._set_bot_commands_and_menu()
-        )
-
-        # Загрузка пользовательских данных
-        self._load_userdata()
+        # Восстановление недоставленных уведомлений
+        # NB: до перезапуска таймеров - сработавший во время инициализации
+        # таймер добавляет уведомление в уже загруженную очередь
+        n_pending = self._outbox.load()
 
-        # Проверка данных, запуск прерванных таймеров, если возможно
-        self._loop.run_until_complete(
-            self._data_check_and_timer_restart()
-        )
+        # Получение user_id, загрузка и проверка данных, установка команд
+        self._loop.run_until_complete(self._run_init_steps())
 
         # Создание задачи автосохранения данных
         self._presistence_task = self._loop.create_task(
             self._persitstence_task()
         )
 
+        # Создание задачи сжатия устаревшей истории
+        self._loop.create_task(self._retention_task())
+
+        # Повторная отправка недоставленных уведомлений
+        if n_pending:
+            self.logger.info(
+                f'{context.get_task_prefix()} {n_pending} undelivered '
+                'notifications restored from outbox'
+            )
+            self._start_outbox_retry()
+
+        # Продолжение прерванной рассылки
+        self._resume_broadcast()
+
+        # Создание задачи контроля задержки loop
+        self._loop_lag_task = self._loop.create_task(
+            self._dispatcher.monitor_loop_lag(),
+            name='loop lag monitor',
+            context=Context()
+        )
+
     @manage_context
     async def _data_check_and_timer_restart(self):
         """Проверка данных, пересоздание таймеров, если возможно."""
@@ -120,7 +189,7 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
                 continue
 
             # Если время еще не вышло, пересоздаем таймер
-            if time() < userdata.timer_end:
+            if self._clock.time() < userdata.timer_end:
                 self.logger.info(
                     f'{context.get_task_prefix()} re-setting timer '
                     f'for user_id={user_id}'
@@ -142,6 +211,10 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
 
         context.propagate_exc.reset(propagate_exc_token)
 
+        # Построение индекса активности пользователей
+        for user_id in self._users:
+            self._update_activity(user_id)
+
         self.logger.info(
             f'{context.get_task_prefix()} User data check completed'
         )
@@ -154,43 +227,197 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
         if not self._persistence_interval:
             return
 
-        await asyncio.sleep(self._persistence_interval)
+        await self._clock.sleep(self._persistence_interval)
         self._save_userdata()
+        self._save_history()
 
         # Пересоздаем задачу
         self._loop.create_task(self._persitstence_task())
 
+    @new_context('retention')
+    @manage_context
+    async def _retention_task(self):
+        """Задача периодического сжатия устаревшей истории событий.
+
+        Сырые записи старше `history_retention_days` сжимаются в агрегаты за
+        час/день (`history_rollup`) по местному времени пользователя.
+        Пользователи обрабатываются порциями по
+        `const.HISTORY_RETENTION_SLICE`, каждая порция - в отдельном потоке
+        (чтение и перезапись чанков не блокируют loop).
+        """
+
+        if not self._history_retention_days:
+            return
+
+        await self._clock.sleep(const.HISTORY_RETENTION_CHECK_INTERVAL)
+
+        before = (
+            self._clock.time()
+            - self._history_retention_days * const.SECONDS_IN_DAY
+        )
+        user_ids = self._history.get_user_ids()
+        n_records = 0
+
+        def compact_slice(tz_offsets: dict[int, int]) -> int:
+            return sum(
+                self._history.compact(
+                    user_id,
+                    before,
+                    self._history_rollup_resolution,
+                    tz_offset
+                )
+                for user_id, tz_offset in tz_offsets.items()
+            )
+
+        for i in range(0, len(user_ids), const.HISTORY_RETENTION_SLICE):
+            # NB: часовые пояса читаются в loop, в поток передается копия
+            n_records += await self._loop.run_in_executor(
+                None,
+                compact_slice,
+                {
+                    user_id: (
+                        userdata.tz_offset
+                        if (userdata := self._users.get(user_id)) else 0
+                    )
+                    for user_id in user_ids[
+                        i:i + const.HISTORY_RETENTION_SLICE
+                    ]
+                }
+            )
+
+        self.logger.info(
+            f'{context.get_task_prefix()} History retention completed: '
+            f'{len(user_ids)} users checked, {n_records} records compacted'
+        )
+
+        # Пересоздаем задачу
+        self._loop.create_task(self._retention_task())
+
+    @manage_context
+    async def _run_init_steps(self):
+        """Шаги инициализации, независимые шаги выполняются параллельно.
+
+        - `get_me` (собственный user_id) и загрузка пользовательских данных
+        (в отдельном потоке)
+        - затем установка команд бота (требует user_id) и проверка данных с
+        перезапуском таймеров (требует загруженных данных)
+
+        Время выполнения шагов логгируется.
+        """
+
+        timings = {}
+
+        async def timed(name: str, awaitable):
+            started_at = perf_counter()
+            result = await awaitable
+            timings[name] = perf_counter() - started_at
+            return result
+
+        started_at = perf_counter()
+
+        me, _ = await asyncio.gather(
+            timed('get_me', self.client.get_me(input_peer=True)),
+            timed(
+                'load_userdata',
+                self._loop.run_in_executor(
+                    None, copy_context().run, self._load_userdata
+                )
+            )
+        )
+        self._self_id = me.user_id
+
+        await asyncio.gather(
+            timed('set_bot_commands', self._set_bot_commands_and_menu()),
+            timed('data_check', self._data_check_and_timer_restart())
+        )
+
+        self.logger.info(
+            f'{context.get_task_prefix()} Init steps completed in '
+            f'{perf_counter() - started_at:.3f} s: '
+            + ', '.join(
+                f'{name} {seconds:.3f} s' for name, seconds in timings.items()
+            )
+        )
+
     @new_context()
     @manage_context
     def shutdown(self):
         """Завершение работы хендлера."""
 
+        for task in (
+            self._presistence_task,
+            self._loop_lag_task,
+            *self._deferred_status_tasks.values()
+        ):
+            if task:
+                task.cancel()
+
         self._save_userdata()
+        self._save_history()
+
+        if self._broadcast:
+            self._save_broadcast()
+
+        self._outbox.compact()
 
     @manage_context
     async def _set_bot_commands_and_menu(self):
-        """Установка (списка) команд бота и кнопки меню."""
+        """Установка (списка) команд бота и кнопки меню.
+
+        Запросы не отправляются, если команды и собственный user_id не
+        изменились с последней установки (хэш в `DATA_PATH/init_state.yaml`).
+        """
+
+        commands_hash = hashlib.sha256(
+            repr((
+                const.BOT_COMMANDS_LANG_CODE,
+                [command.to_dict() for command in const.BOT_COMMANDS_DEFAULT],
+                self._self_id
+            )).encode('utf-8')
+        ).hexdigest()
+
+        # NB: отложенный импорт - зависимость не нужна при импорте модуля
+        import yaml
+
+        if (filename := self.data_path / 'init_state.yaml').is_file():
+            with filename.open('r') as file:
+                if (yaml.safe_load(file) or {}).get('commands_hash') == (
+                    commands_hash
+                ):
+                    return self.logger.info(
+                        f'{context.get_task_prefix()} Bot commands '
+                        'unchanged, skipping'
+                    )
 
-        await self._client_call(
-            functions.bots.SetBotCommandsRequest(
-                scope=types.BotCommandScopeUsers(),
-                lang_code=const.BOT_COMMANDS_LANG_CODE,
-                commands=const.BOT_COMMANDS_DEFAULT
+        await asyncio.gather(
+            self._client_call(
+                functions.bots.SetBotCommandsRequest(
+                    scope=types.BotCommandScopeUsers(),
+                    lang_code=const.BOT_COMMANDS_LANG_CODE,
+                    commands=const.BOT_COMMANDS_DEFAULT
+                ),
             ),
+            self._client_call(
+                functions.bots.SetBotMenuButtonRequest(
+                    user_id=types.InputUserEmpty(),
+                    button=types.BotMenuButtonCommands(),
+                )
+            )
         )
 
-        await self._client_call(
-            functions.bots.SetBotMenuButtonRequest(
-                user_id=types.InputUserEmpty(),
-                button=types.BotMenuButtonCommands(),
+        with filename.open('w') as file:
+            yaml.safe_dump(
+                {'commands_hash': commands_hash, 'self_id': self._self_id},
+                file
             )
-        )
 
-    @new_context('filter event', event_handling=True)
-    @manage_context
+        self.logger.info(f'{context.get_task_prefix()} Bot commands set')
+
+    # NB: no @new_context / @manage_context here - filter is context-free
     def filter_event(
         self,
-        event: events.NewMessage.Event | events.CallbackQuery.Event
+        event: events.NewMessage.Event | events.CallbackQuery.Event,
+        check_duplicate: bool = True
     ) -> bool:
         """Фильтрация входящих событий (обновлений).
 
@@ -200,29 +427,49 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
         - `CallbackQuery` - callback-запросы из чатов, `via_inline` запросы
         игнорируются.
 
+        Если `check_duplicate=True`, повторно доставленные обновления
+        (сообщение с тем же `(chat_id, msg_id)`, callback-запрос с тем же
+        `query_id` в течение `const.DEDUP_TTL` сек) игнорируются.
+
+        Фильтр вызывается для каждого обновления, поэтому проверка выполняется
+        без создания контекста: полный контекст создается обработчиком только
+        для прошедших фильтр событий.
+
         Возвращаемый тип `bool`: cобытие прошло фильтр - `True`, иначе `False`.
         """
 
         # Новое сообщение
-        if (isinstance(event, events.NewMessage.Event)):
-
-            if (event.message.is_private and not event.message.action):
-                return True
+        if isinstance(event, events.NewMessage.Event):
+
+            if not ((msg := event.message).is_private and not msg.action):
+                # NB: строка формируется, только если DEBUG включен
+                if self.logger.isEnabledFor(DEBUG):
+                    self.logger.debug(
+                        '[ filter event ] '
+                        f'{helpers.get_chat_at_id_string(msg)} message is '
+                        'either service one or not private, ignore.'
+                    )
+                return False
 
-            # NB: logger.info() returns None
-            return bool(self.logger.info(
-                f'{context.get_task_prefix()} message is either '
-                'service one or not private, ignore.'
-            ))
+            key = (msg.chat_id, msg.id)
 
         # callback-запрос
-        return (
-            (
-                isinstance(event, events.CallbackQuery.Event)
-                and not event.via_inline
+        elif (
+            isinstance(event, events.CallbackQuery.Event)
+            and not event.via_inline
+        ):
+            key = event.id
+
+        else:
+            return False
+
+        if check_duplicate and self._seen_updates.check_and_add(key):
+            self.logger.info(
+                f'[ filter event ] duplicate update {key}, ignore.'
             )
-            or False
-        )
+            return False
+
+        return True
 
     @new_context('new message', event_handling=True)
     @manage_context
@@ -232,7 +479,7 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
         # Проверка контекста
         await self._check_contextvars(extra_vars=('msg',))
 
-        self._get_or_create_userdata().last_seen = time()
+        self._get_or_create_userdata().last_seen = self._clock.time()
 
         self.logger.info(
             f'{context.get_task_prefix()} message info: '
@@ -245,10 +492,13 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
             and (command_name := command.pop('name'))
             and (handler := getattr(self, f'_on_command_{command_name}'))
         ):
-            return await handler(**command)
+            await handler(**command)
+
+        else:
+            # Сообщаем, что не поняли, что хочет пользователь
+            await self._set_reaction_not_understood()
 
-        # Сообщаем, что не поняли, что хочет пользователь
-        await self._set_reaction_not_understood()
+        self._update_activity()
 
     @manage_context
     async def _on_command_start(self, **kwargs):
@@ -440,9 +690,10 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
             return self.logger.info(log_success_string + ': alredy running')
 
         userdata.is_running = True
-        userdata.ran_at = time()
+        userdata.ran_at = self._clock.time()
         userdata.sig_available = userdata.initial_sig
         userdata.sig_smoked = 0
+        self._record_event(const.HISTORY_EVENT_RUN)
 
         # Ручной режим, есть доступные сигареты -> таймер на паузу
         if userdata.mode == 'manual' and userdata.sig_available > 0:
@@ -464,8 +715,9 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
 
         # Если сервис запущен - останавливаем таймер
         # и сообщаем о кол-ве выкупенных сигарет
-        if userdata.is_running:
+        if (stopped_now := userdata.is_running):
             userdata.is_running = False
+            self._record_event(const.HISTORY_EVENT_STOP)
 
             # Останавливаем таймер
             if userdata.is_timer:
@@ -481,7 +733,7 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
                 + (
                     const.MSG_STOP_AVG_INTEVAL.format(
                         avg_intrerval=(helpers.get_timedelta_string(
-                            (time() - userdata.ran_at)
+                            (self._clock.time() - userdata.ran_at)
                             / (userdata.sig_smoked - 1)
                         ))
                     )
@@ -490,7 +742,8 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
                 )
             )
 
-        await self._send_status_msg()
+        # Статус обязателен, только если таймер не был запущен
+        await self._send_status_msg(essential=not stopped_now)
         self.logger.info(
             f'{context.get_task_prefix()} '
             f'/stop command handled {const.EMOJI_OK}'
@@ -522,45 +775,85 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
 
         userdata.sig_available -= 1
         userdata.sig_smoked += 1
+        self._record_event(const.HISTORY_EVENT_SMOKE)
 
         # Если режим ручной, и кол-во доступных сигарет == 0
         # то запускаем таймер
         if userdata.mode == 'manual' and userdata.sig_available == 0:
             self._set_timer()
 
+        # NB: сообщения отправляются последовательно - при конкурентной
+        # отправке порядок их появления в чате не гарантируется
         await self._send_message(
             context.sender.get(),
             const.MSG_SMOKE_AFFIRMATIVE
         )
-        await self._send_status_msg()
+        await self._send_status_msg(essential=False)
         self.logger.info(log_success_string)
 
+    @manage_context
+    async def _on_command_stats(self, **kwargs):
+        """Обработчик команды /stats."""
+
+        await self._send_message(
+            context.sender.get(),
+            self._build_stats_msg()
+        )
+
+        self.logger.info(
+            f'{context.get_task_prefix()} /stats command handled '
+            f'{const.EMOJI_OK}'
+        )
+
     @manage_context
     async def _on_command_info(self, **kwargs):
         """Обработчик команды администратора /info."""
 
+        # NB: отложенный импорт - psutil нужен только для /info
+        import psutil
+
         # Доступно только администратору бота
         if context.sender_id.get() not in self._admin_ids:
             return await self._set_reaction_not_understood()
 
-        time_now = time()
+        time_now = self._clock.time()
+        calc_started_at = perf_counter()
+
+        # Пользователи, не блокировавшие бота и активные за период
+        n_users_day = self._activity.count_active(
+            const.SECONDS_IN_DAY, time_now
+        )
+        n_users_week = self._activity.count_active(
+            const.SECONDS_IN_WEEK, time_now
+        )
+        n_users_month = self._activity.count_active(
+            const.SECONDS_IN_MONTH, time_now
+        )
+
+        calc_ms = (perf_counter() - calc_started_at) * 1000
 
         await self._send_message(
             context.sender.get(),
             const.MSG_INFO.format(
-                n_users=len([
-                    user_id for user_id, userdata in self._users.items()
-                    if (
-                        # пользователь не блокировал бота
-                        userdata.is_active_user
-                        # был активен менее чем неделю назад
-                        and (
-                            (time_now - userdata.last_seen)
-                            < const.SECONDS_IN_WEEK
-                        )
+                n_users_day=n_users_day,
+                n_users_week=n_users_week,
+                n_users_month=n_users_month,
+                n_timers_running=self._activity.n_running,
+                n_timers_paused=self._activity.n_paused,
+                calc_ms=calc_ms,
+                mem_mb=(psutil.Process().memory_info().rss / (1024 ** 2)),
+                n_pending=self._dispatcher.n_pending,
+                n_running=self._dispatcher.n_running,
+                loop_lag_ms=self._dispatcher.loop_lag * 1000,
+                n_duplicates=self._seen_updates.n_hits,
+                duplicate_rate=self._seen_updates.hit_rate,
+                shed_counts=(
+                    ', '.join(
+                        f'{reason}: {n}' for reason, n
+                        in self._dispatcher.shed_counts.items()
                     )
-                ]),
-                mem_mb=(psutil.Process().memory_info().rss / (1024 ** 2))
+                    or '-'
+                )
             )
         )
 
@@ -569,6 +862,25 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
             f'/info command handled {const.EMOJI_OK}'
         )
 
+    def _on_event_dropped(self, ctx: Context, reason: str):
+        """Ответить на отброшенный диспетчером callback-запрос.
+
+        Дубликат подтверждается без сообщения (такой же запрос ожидает
+        обработки), в остальных случаях - уведомление о перегрузке.
+        """
+
+        if isinstance(
+            event := ctx.get(context.event), events.CallbackQuery.Event
+        ):
+            self._loop.create_task(
+                self._answer_callback_query(
+                    event,
+                    None if reason == const.SHED_POLICY_DEDUP_CALLBACKS
+                    else const.MSG_CALLBACK_BUSY
+                ),
+                context=ctx
+            )
+
     @new_context('callback query', event_handling=True)
     @manage_context
     async def on_callback_query(self, event: events.CallbackQuery.Event):
@@ -577,24 +889,32 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
         # Проверка контекста
         await self._check_contextvars(extra_vars=('query_data',))
 
-        self._get_or_create_userdata().last_seen = time()
+        self._get_or_create_userdata().last_seen = self._clock.time()
 
-        # Подтверждаем получение
-        await event.answer()
+        async with CallGroup() as calls:
 
-        decoded_data = context.query_data.get().decode('utf-8')
+            # Подтверждаем получение (параллельно с обработкой)
+            calls.start(self._answer_callback_query(event))
 
-        self.logger.info(
-            f'{context.get_task_prefix()} callback data: \'{decoded_data}\''
-        )
+            decoded_data = context.query_data.get().decode('utf-8')
 
-        # Если сообщение содержит команду, вызываем соответсвующий обработчик
-        if (
-            (command := helpers.get_callback_command_from_string(decoded_data))
-            and (command_name := command.pop('name'))
-            and (handler := getattr(self, f'_on_callback_{command_name}'))
-        ):
-            return await handler(**command)
+            self.logger.info(
+                f'{context.get_task_prefix()} callback data: '
+                f'\'{decoded_data}\''
+            )
+
+            # Если сообщение содержит команду, вызываем соответсвующий
+            # обработчик
+            if (
+                (command := helpers.get_callback_command_from_string(
+                    decoded_data
+                ))
+                and (command_name := command.pop('name'))
+                and (handler := getattr(self, f'_on_callback_{command_name}'))
+            ):
+                await handler(**command)
+
+            self._update_activity()
 
     @manage_context
     async def _on_callback_status_update(self):
@@ -616,16 +936,20 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
         # Установка значения
         if kwargs.get('action') == 'set':
 
-            # Удаляем техническое сообщение
-            await self._delete_messages(
-                context.sender.get(),
-                context.msg_id.get()
-            )
+            async with CallGroup() as calls:
 
-            # Выполняем обычную команду установки значения
-            return await self._on_command_setinterval(
-                interval=kwargs['interval']
-            )
+                # Удаляем техническое сообщение (параллельно с подтверждением)
+                calls.start(
+                    self._delete_messages(
+                        context.sender.get(),
+                        context.msg_id.get()
+                    )
+                )
+
+                # Выполняем обычную команду установки значения
+                return await self._on_command_setinterval(
+                    interval=kwargs['interval']
+                )
 
         # Изменение значения (до установки) - обновляем техническое сообщение
         message, buttons = self._build_setinterval_msg(kwargs['interval'])
@@ -649,14 +973,18 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
         # Установка значения
         if kwargs.get('action') == 'set':
 
-            # Удаляем техническое сообщение
-            await self._delete_messages(
-                context.sender.get(),
-                context.msg_id.get()
-            )
+            async with CallGroup() as calls:
+
+                # Удаляем техническое сообщение (параллельно с подтверждением)
+                calls.start(
+                    self._delete_messages(
+                        context.sender.get(),
+                        context.msg_id.get()
+                    )
+                )
 
-            # Выполняем обычную команду установки значения
-            return await self._on_command_setmode(mode=kwargs['mode'])
+                # Выполняем обычную команду установки значения
+                return await self._on_command_setmode(mode=kwargs['mode'])
 
         # Изменение значения (до установки) - обновляем техническое сообщение
         message, buttons = self._build_setmode_msg(kwargs['mode'])
@@ -680,16 +1008,20 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
         # Установка значения
         if kwargs.get('action') == 'set':
 
-            # Удаляем техническое сообщение
-            await self._delete_messages(
-                context.sender.get(),
-                context.msg_id.get()
-            )
+            async with CallGroup() as calls:
 
-            # Выполняем обычную команду установки значения
-            return await self._on_command_setinitial(
-                initial_sig=kwargs['initial_sig']
-            )
+                # Удаляем техническое сообщение (параллельно с подтверждением)
+                calls.start(
+                    self._delete_messages(
+                        context.sender.get(),
+                        context.msg_id.get()
+                    )
+                )
+
+                # Выполняем обычную команду установки значения
+                return await self._on_command_setinitial(
+                    initial_sig=kwargs['initial_sig']
+                )
 
         # Изменение значения (до установки) - обновляем техническое сообщение
         message, buttons = self._build_setinitial_msg(kwargs['initial_sig'])
@@ -713,14 +1045,20 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
         # Установка значения
         if kwargs.get('action') == 'set':
 
-            # Удаляем техническое сообщение
-            await self._delete_messages(
-                context.sender.get(),
-                context.msg_id.get()
-            )
+            async with CallGroup() as calls:
+
+                # Удаляем техническое сообщение (параллельно с подтверждением)
+                calls.start(
+                    self._delete_messages(
+                        context.sender.get(),
+                        context.msg_id.get()
+                    )
+                )
 
-            # Выполняем обычную команду установки значения
-            return await self._on_command_settz(tz_offset=kwargs['tz_offset'])
+                # Выполняем обычную команду установки значения
+                return await self._on_command_settz(
+                    tz_offset=kwargs['tz_offset']
+                )
 
         # Изменение значения (до установки) - обновляем техническое сообщение
         message, buttons = self._build_settz_msg(kwargs['tz_offset'])
@@ -746,6 +1084,7 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
 
         userdata.is_active_user = False
         userdata.is_running = False
+        self._update_activity(user_id)
 
         # Останавливаем таймер
         if userdata.is_timer:
@@ -760,7 +1099,13 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
 
     @manage_context
     async def _set_reaction_not_understood(self) -> None:
-        """Установить для сообщения в контексте emoji реакцию: 'не понял'."""
+        """Установить для сообщения в контексте emoji реакцию: 'не понял'.
+
+        При перегрузке реакция не ставится (политика `skip_reactions`).
+        """
+
+        if self._dispatcher.shed(const.SHED_POLICY_SKIP_REACTIONS):
+            return
 
         await self._set_reaction_emoji(const.EMOJI_SHRUG)
         self.logger.info(
@@ -829,6 +1174,9 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
             )
         ]]
 
+        # Пересчитываются только текущее и оставшееся время
+        time_now = self._clock.time()
+
         if not userdata.is_timer:
             return (
                 const.MSG_STATUS_PAUSED.format(
@@ -837,7 +1185,7 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
                         const.EMOGI_GREEN_CIRCLE if userdata.sig_available
                         else const.EMOGI_YELLOW_CIRCLE
                     ),
-                    now=helpers.get_time_string(time(), userdata.tz_offset)
+                    now=helpers.get_time_string(time_now, userdata.tz_offset)
                 ),
                 buttons
             )
@@ -849,17 +1197,145 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
                         const.EMOGI_GREEN_CIRCLE if userdata.sig_available
                         else const.EMOGI_YELLOW_CIRCLE
                 ),
-                timer_end=helpers.get_time_string(
+                # Строка времени окончания кэшируется на время жизни таймера
+                timer_end=helpers.get_timer_end_string(
                     userdata.timer_end, userdata.tz_offset
                 ),
                 time_remaining=helpers.get_timedelta_string(
-                    userdata.timer_end - time()
+                    userdata.timer_end - time_now
                 ),
-                now=helpers.get_time_string(time(), userdata.tz_offset)
+                now=helpers.get_time_string(time_now, userdata.tz_offset)
             ),
             buttons
         )
 
+    @manage_context
+    def _build_stats_msg(self) -> str:
+        """Сформировать сообщение со статистикой пользователя.
+
+        Сводные значения (кол-ва, интервалы) - из агрегатов `stat_*`, по
+        дням - по истории событий (сжатая история - по ее агрегатам),
+        детали интервалов - только по несжатой истории. Сообщение кэшируется
+        до следующего события пользователя (или смены настроек, даты).
+        """
+
+        # NB: отложенный импорт - numpy нужен только для статистики
+        from . import stats
+
+        user_id = context.sender_id.get()
+        userdata = self._get_or_create_userdata()
+        time_now = self._clock.time()
+
+        cache_key = (
+            userdata.interval,
+            userdata.tz_offset,
+            helpers.get_date_string(time_now, userdata.tz_offset)
+        )
+        if (cached := self._stats_cache.get(user_id)) and (
+            cached[0] == cache_key
+        ):
+            return cached[1]
+
+        if not userdata.stat_total:
+            return const.MSG_STATS_NO_DATA
+
+        # Сводные значения - из агрегатов, без обращения к истории
+        rollup_stats = stats.get_rollup_stats(userdata, time_now)
+        user_stats = stats.get_stats(
+            stats.get_records_array(self._history.iter_chunks(user_id)),
+            userdata.interval,
+            userdata.tz_offset,
+            time_now,
+            rollups=stats.get_rollups_array(
+                self._history.iter_rollups(user_id)
+            )
+        )
+
+        day_counts = user_stats['day_counts']
+        histogram = user_stats['histogram']
+        bin_edges = [
+            edge * userdata.interval for edge in const.STATS_HIST_BINS
+        ]
+
+        message = const.MSG_STATS.format(
+            today_count=rollup_stats['today_count'],
+            week_count=rollup_stats['week_count'],
+            total=rollup_stats['total'],
+            avg_per_day=user_stats['avg_per_day'],
+            avg_per_day_prev=user_stats['avg_per_day_prev'],
+            trend=(
+                const.STR_TREND_UP if (
+                    user_stats['avg_per_day'] > user_stats['avg_per_day_prev']
+                )
+                else const.STR_TREND_DOWN if (
+                    user_stats['avg_per_day'] < user_stats['avg_per_day_prev']
+                )
+                else const.STR_TREND_FLAT
+            ),
+            days='\n'.join(
+                const.STR_STATS_DAY.format(
+                    date=helpers.get_date_string(
+                        time_now - days_ago * const.SECONDS_IN_DAY,
+                        userdata.tz_offset
+                    ),
+                    count=count,
+                    bar=helpers.get_bar_string(count, day_counts.max())
+                )
+                for days_ago, count in enumerate(day_counts.tolist())
+            ),
+            interval=userdata.interval,
+            intervals=(
+                const.MSG_STATS_INTERVALS.format(
+                    mean_interval=helpers.get_timedelta_string(
+                        rollup_stats['mean_interval']
+                    ),
+                    std_interval=helpers.get_timedelta_string(
+                        rollup_stats['std_interval']
+                    ),
+                    min_interval=helpers.get_timedelta_string(
+                        rollup_stats['min_interval']
+                    ),
+                    max_interval=helpers.get_timedelta_string(
+                        rollup_stats['max_interval']
+                    ),
+                    details=(
+                        const.MSG_STATS_INTERVALS_DETAILS.format(
+                            median_interval=helpers.get_timedelta_string(
+                                user_stats['median_interval']
+                            ),
+                            share_ok=user_stats['share_ok'],
+                            histogram='\n'.join(
+                                const.STR_STATS_HIST_BIN.format(
+                                    label=(
+                                        f'{low:.0f}-{high:.0f}'
+                                        if high != float('inf')
+                                        else f'≥ {low:.0f}'
+                                    ),
+                                    count=count,
+                                    bar=helpers.get_bar_string(
+                                        count, histogram.max()
+                                    )
+                                )
+                                for low, high, count in zip(
+                                    bin_edges, bin_edges[1:],
+                                    histogram.tolist()
+                                )
+                            )
+                        )
+                        if user_stats['n_intervals'] else ''
+                    )
+                )
+                if rollup_stats['mean_interval'] is not None
+                else const.MSG_STATS_NO_INTERVALS
+            ),
+            streak=user_stats['streak'],
+            best_streak=user_stats['best_streak']
+        )
+
+        self._stats_cache[user_id] = (cache_key, message)
+
+        return message
+
     @manage_context
     def _build_setinterval_msg(
         self,
@@ -1043,8 +1519,34 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
         return const.MSG_SETTZ.format(tz_offset=tz_offset), buttons
 
     @manage_context
-    async def _send_status_msg(self):
-        """Отправить сообщение со статусом сервиса."""
+    async def _send_status_msg(self, essential: bool = True):
+        """Отправить сообщение со статусом сервиса.
+
+        Необязательное (`essential=False`) сообщение при перегрузке
+        откладывается (политика `defer_status`). У пользователя не более
+        одного отложенного сообщения: новое сообщение отменяет предыдущее.
+        """
+
+        user_id = context.sender_id.get()
+
+        if task := self._deferred_status_tasks.pop(user_id, None):
+            task.cancel()
+
+        if (
+            not essential
+            and self._dispatcher.shed(const.SHED_POLICY_DEFER_STATUS)
+        ):
+            # Задача создается в копии текущего контекста
+            task = self._loop.create_task(
+                self._send_deferred_status_msg(),
+                name=f'deferred status @ {user_id}'
+            )
+            self._deferred_status_tasks[user_id] = task
+            task.add_done_callback(
+                lambda task: self._deferred_status_tasks.get(user_id) is task
+                and self._deferred_status_tasks.pop(user_id)
+            )
+            return
 
         message, buttons = self._build_status_msg()
 
@@ -1054,11 +1556,28 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
             buttons=buttons
         )
 
+    @manage_context
+    async def _send_deferred_status_msg(self):
+        """Отправить сообщение со статусом после окончания перегрузки."""
+
+        if await self._dispatcher.wait_not_overloaded(
+            const.STATUS_DEFER_TIMEOUT
+        ):
+            # NB: задача удаляется из отложенных до отправки, иначе
+            # _send_status_msg() отменит ее саму
+            self._deferred_status_tasks.pop(context.sender_id.get(), None)
+            return await self._send_status_msg()
+
+        self._dispatcher.count_shed('status_expired')
+        self.logger.info(
+            f'{context.get_task_prefix()} deferred status message expired'
+        )
+
     @manage_context
     def _set_timer(
         self,
         user_id: int | None = None,
-        user: types.User | None = None,
+        user: types.User | types.InputPeerUser | None = None,
         timer_end: float | None = None
     ):
         """Создать отложенную задачу проверки таймера (wakeup).
@@ -1069,7 +1588,7 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
 
         user_id = user_id or context.sender_id.get()
         userdata = self._get_or_create_userdata(user_id)
-        time_now = time()
+        time_now = self._clock.time()
 
         wakeup_in_seconds = (
             timer_end - time_now if timer_end
@@ -1082,12 +1601,17 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
         task_name = helpers.get_wakeup_task_name(user_id)
 
         # Создаем новый контекст для wakeup call
+        # NB: в режиме 'auto' контекст живет, пока работает таймер, поэтому
+        # вместо полного объекта пользователя хранится только InputPeerUser
         ctx = Context()
         ctx.run(
             context.init_contextvars,
             task_name_val=task_name,
             sender_id_val=user_id,
-            sender_val=(user or context.sender.get()),
+            sender_val=(
+                helpers.get_input_peer_user(sender)
+                if (sender := user or context.sender.get()) else None
+            ),
         )
 
         self.logger.info(
@@ -1109,10 +1633,10 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
             f'{context.get_task_prefix()} timer is set, sleeping '
             f'{wakeup_in_seconds:.1f} seconds'
         )
-        await asyncio.sleep(wakeup_in_seconds)
+        await self._clock.sleep(wakeup_in_seconds)
 
         userdata = self._get_or_create_userdata()
-        time_now = time()
+        time_now = self._clock.time()
 
         if (
             not userdata.is_running           # сервис остановлен
@@ -1124,6 +1648,7 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
         ):
             userdata.is_running = False
             userdata.is_timer = False
+            self._update_activity()
             await self._send_message(
                 context.sender.get(),
                 const.MSG_ERROR_CHECK_SETTINGS
@@ -1132,9 +1657,9 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
 
         # Увеличиваем кол-во доступных сигарет
         userdata.sig_available += 1
+        self._record_event(const.HISTORY_EVENT_WAKEUP)
 
-        await self._send_message(
-            context.sender.get(),
+        await self._send_notification(
             const.MSG_NEW_CIG_AVALABLE.format(
                 sig_available=userdata.sig_available
             )
@@ -1145,6 +1670,7 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
         # В режиме 'manual' таймер не перезапускаем
         if userdata.mode == 'manual':
             userdata.is_timer = False
+            self._update_activity()
             return self.logger.debug(
                 f'{context.get_task_prefix()} timer is stopped'
             )
@@ -1160,6 +1686,116 @@ class SmokerBotHandler(UserdataMixin, ClientMixin, BaseHandler):
             name=context.task_name.get()
         )
 
+    @manage_context
+    async def _send_notification(self, text: str):
+        """Отправить уведомление пользователю через очередь исходящих.
+
+        Уведомление записывается в журнал очереди до отправки и удаляется
+        после доставки. Журнал сбрасывается на диск пакетно, не позднее
+        `const.OUTBOX_SYNC_INTERVAL` сек. Неудачные отправки повторяются
+        задачей `_outbox_task()`.
+        """
+
+        entry_id = self._outbox.add(context.sender_id.get(), text)
+        self._schedule_outbox_flush()
+
+        delivered = False
+        try:
+            delivered = bool(
+                await self._send_message(context.sender.get(), text)
+            )
+        finally:
+            self._resolve_outbox_entry(entry_id, delivered)
+
+    @manage_context
+    async def _retry_outbox_entry(self, entry: OutboxEntry):
+        """Повторная отправка уведомления из очереди исходящих."""
+
+        # Пользователь заблокировал бота - уведомление отбрасывается
+        if not (
+            (userdata := self._users.get(entry.user_id))
+            and userdata.is_active_user
+        ):
+            return self._resolve_outbox_entry(entry.id, None)
+
+        # NB: sender_id нужен для обработки UserIsBlockedError
+        sender_id_token = context.sender_id.set(entry.user_id)
+        delivered = False
+        try:
+            delivered = bool(
+                await self._send_message(entry.user_id, entry.text)
+            )
+        finally:
+            context.sender_id.reset(sender_id_token)
+            self._resolve_outbox_entry(entry.id, delivered)
+
+    def _resolve_outbox_entry(self, entry_id: int, delivered: bool | None):
+        """Отметить результат отправки уведомления из очереди исходящих.
+
+        `delivered`: `True` - доставлено, `False` - неудачная попытка (будет
+        повторена), `None` - отброшено.
+        """
+
+        if delivered:
+            self._outbox.done(entry_id)
+        elif delivered is None:
+            self._outbox.done(entry_id, delivered=False)
+        elif self._outbox.fail(entry_id):
+            self._start_outbox_retry()
+
+        self._schedule_outbox_flush()
+
+    def _start_outbox_retry(self):
+        """Запустить задачу повторных отправок, если она не запущена."""
+
+        if self._outbox_retry_task and not self._outbox_retry_task.done():
+            return
+
+        # NB: задача создается явно (не через new_context), чтобы хранить
+        # ссылку на саму задачу, а не на обертку, завершающуюся сразу
+        ctx = Context()
+        ctx.run(context.init_contextvars, task_name_val='outbox')
+        self._outbox_retry_task = self._loop.create_task(
+            self._outbox_task(),
+            name='outbox',
+            context=ctx
+        )
+
+    @manage_context
+    async def _outbox_task(self):
+        """Задача повторной отправки уведомлений из очереди исходящих.
+
+        Работает, пока в очереди есть уведомления, ожидающие повтора.
+        """
+
+        while (next_try_at := self._outbox.get_next_try_at()) is not None:
+            await self._clock.sleep(next_try_at - self._clock.time())
+
+            for entry in self._outbox.get_due():
+                await self._retry_outbox_entry(entry)
+
+        self.logger.info(
+            f'{context.get_task_prefix()} outbox retries completed: '
+            f'{self._outbox.n_delivered} delivered, '
+            f'{self._outbox.n_dropped} dropped in total'
+        )
+
+    def _schedule_outbox_flush(self):
+        """Запланировать сброс журнала очереди исходящих на диск."""
+
+        if not self._outbox_flush_handle:
+            self._outbox_flush_handle = self._loop.call_later(
+                const.OUTBOX_SYNC_INTERVAL, self._flush_outbox
+            )
+
+    @new_context('outbox flush')
+    @manage_context
+    def _flush_outbox(self):
+        """Сбросить журнал очереди исходящих на диск (fsync)."""
+
+        self._outbox_flush_handle = None
+        self._outbox.flush()
+
     @manage_context
     async def _cancel_task_by_name(self, name: str):
         """Отменить все asyncio задачи с заданным именем для текущего loop."""
@@ -1,7 +1,8 @@
 import datetime as dt
+import functools
 import math
 
-from telethon import types
+from telethon import types, utils
 from telethon.tl.custom.message import Message
 
 from . import const
@@ -97,17 +98,50 @@ def get_message_info_string(msg: Message) -> str:
     )
 
 
+@functools.cache
+def get_timezone(tz_offset: int) -> dt.timezone:
+    """Get (cached) `datetime.timezone` object for given offset in hours."""
+
+    return dt.timezone(dt.timedelta(hours=tz_offset))
+
+
 def get_time_string(posix_time: float, tz_offset: int) -> str:
     """Get time string given POSIX time and time zone offset."""
 
     return (
-        dt.datetime.fromtimestamp(
-            posix_time,
-            dt.timezone(dt.timedelta(hours=tz_offset))
-        ).strftime('%H:%M')
+        dt.datetime.fromtimestamp(posix_time, get_timezone(tz_offset))
+        .strftime('%H:%M')
+    )
+
+
+def get_date_string(posix_time: float, tz_offset: int) -> str:
+    """Get dd.mm date string given POSIX time and time zone offset."""
+
+    return (
+        dt.datetime.fromtimestamp(posix_time, get_timezone(tz_offset))
+        .strftime('%d.%m')
+    )
+
+
+def get_bar_string(value: int, max_value: int) -> str:
+    """Get text bar of length proportional to `value / max_value`."""
+
+    return const.STR_STATS_BAR * (
+        round(value / max_value * const.STATS_BAR_LENGTH) if max_value else 0
     )
 
 
+@functools.lru_cache(maxsize=const.TIME_STRING_CACHE_SIZE)
+def get_timer_end_string(timer_end: float, tz_offset: int) -> str:
+    """Get (cached) time string for timer end time.
+
+    Timer end time stays the same for the whole life of a timer, so the
+    formatted string is reused by all status renders of the timer.
+    """
+
+    return get_time_string(timer_end, tz_offset)
+
+
 def get_timedelta_string(seconds: float) -> str:
     """Get hh:mm{.ss} string from timedelta in seconds."""
 
@@ -128,3 +162,18 @@ def get_wakeup_task_name(user_id: int) -> str:
     """
 
     return f'wakeup @ {user_id}'
+
+
+def get_input_peer_user(
+    user: types.User | types.InputPeerUser
+) -> types.User | types.InputPeerUser:
+    """Получить компактную ссылку `InputPeerUser` на пользователя.
+
+    Если ссылка не может быть создана (нет `access_hash`, `min` объект),
+    возвращается исходный объект пользователя.
+    """
+
+    try:
+        return utils.get_input_peer(user, allow_self=False)
+    except TypeError:
+        return user
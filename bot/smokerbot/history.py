@@ -0,0 +1,267 @@
+import mmap
+import threading
+from array import array
+from collections import Counter
+from collections.abc import Iterator
+from pathlib import Path
+
+from . import const
+
+# Запись истории - пара uint32: (POSIX время, тип события)
+RECORD_TYPECODE = 'I'
+RECORD_LEN = 2
+
+CHUNK_SUFFIX = '.u32'
+
+# Запись агрегата - тройка uint32: (начало периода, тип события, кол-во)
+ROLLUP_RECORD_LEN = 3
+ROLLUP_PREFIX = 'rollup_'
+
+
+class EventHistory:
+    """Хранилище истории событий пользователей.
+
+    История пользователя - append-only временной ряд записей
+    `(timestamp, kind)`, упакованных в uint32. Новые записи накапливаются в
+    памяти (`array`) и сбрасываются на диск методом `flush()` в файлы-чанки
+    `<path>/<user_id>/<chunk_no>.u32` по `chunk_size` записей в каждом.
+
+    При чтении чанки отображаются в память (mmap), т.е. не копируются и не
+    создают python-объектов на каждую запись.
+
+    Устаревшие чанки могут быть сжаты (`compact()`) в агрегаты - кол-во
+    событий каждого типа за период (час, день, по местному времени
+    пользователя), файлы `<path>/<user_id>/rollup_<resolution>.u32`.
+
+    NB: `compact()` может выполняться в отдельном потоке, запись на диск
+    (`flush()`, `compact()`) защищена блокировкой.
+    """
+
+    def __init__(self, path: Path, chunk_size: int = const.HISTORY_CHUNK_SIZE):
+        self.path = path
+        self._chunk_size = chunk_size
+
+        # Несохраненные записи {user_id: array}
+        self._buffers: dict[int, array] = {}
+
+        # Последний чанк на диске {user_id: (chunk_no, n_records)}
+        self._tails: dict[int, tuple[int, int]] = {}
+
+        self._lock = threading.Lock()
+
+    def append(self, user_id: int, kind: int, timestamp: float):
+        """Добавить запись о событии `kind` в историю пользователя."""
+
+        if (buffer := self._buffers.get(user_id)) is None:
+            buffer = self._buffers[user_id] = array(RECORD_TYPECODE)
+
+        buffer.append(int(timestamp))
+        buffer.append(kind)
+
+    def flush(self) -> int:
+        """Сбросить накопленные записи на диск.
+
+        Возвращает кол-во сохраненных записей.
+        """
+
+        n_records = 0
+
+        with self._lock:
+            for user_id, buffer in list(self._buffers.items()):
+                self._write_records(user_id, buffer)
+                # NB: буфер удаляется сразу после записи - при ошибке записи
+                # следующих пользователей сохраненные записи не повторяются
+                del self._buffers[user_id]
+                n_records += len(buffer) // RECORD_LEN
+
+        return n_records
+
+    def iter_chunks(self, user_id: int) -> Iterator[memoryview]:
+        """Итератор по записям истории пользователя.
+
+        Каждый элемент - плоский `memoryview` uint32 значений
+        `[ts_0, kind_0, ts_1, kind_1, ...]`: сохраненные чанки (mmap) в
+        порядке записи, затем несохраненные записи из памяти.
+        """
+
+        for chunk_path in self._get_chunk_paths(user_id):
+            if records := self._map_file(chunk_path):
+                yield records
+
+        # NB: копия, т.к. array с экспортированным буфером нельзя расширить
+        if buffer := self._buffers.get(user_id):
+            yield memoryview(buffer[:])
+
+    def iter_rollups(self, user_id: int) -> Iterator[tuple[int, memoryview]]:
+        """Итератор по агрегатам истории пользователя.
+
+        Каждый элемент - кортеж `(resolution, records)`, где `records` -
+        плоский `memoryview` uint32 значений `[start_0, kind_0, count_0, ...]`.
+        NB: записи за один период могут повторяться, их нужно суммировать.
+        """
+
+        if not (user_path := self.path / str(user_id)).is_dir():
+            return
+
+        for rollup_path in sorted(
+            user_path.glob(f'{ROLLUP_PREFIX}*{CHUNK_SUFFIX}')
+        ):
+            if records := self._map_file(rollup_path):
+                yield (
+                    int(rollup_path.stem.removeprefix(ROLLUP_PREFIX)),
+                    records
+                )
+
+    def get_user_ids(self) -> list[int]:
+        """Получить список пользователей с сохраненной историей."""
+
+        if not self.path.is_dir():
+            return []
+
+        return [
+            int(user_path.name) for user_path in self.path.iterdir()
+            if user_path.is_dir() and user_path.name.isdigit()
+        ]
+
+    def compact(
+        self,
+        user_id: int,
+        before: float,
+        resolution: int,
+        tz_offset: int = 0
+    ) -> int:
+        """Сжать чанки пользователя, все записи которых старше `before`.
+
+        Записи чанка агрегируются в кол-во событий каждого типа за период
+        `resolution` секунд, периоды отсчитываются по местному времени
+        пользователя (`tz_offset`, ч), агрегаты дописываются в файл
+        `rollup_<resolution>.u32`, исходный чанк удаляется.
+
+        Возвращает кол-во сжатых записей.
+        """
+
+        with self._lock:
+            return self._compact(user_id, before, resolution, tz_offset)
+
+    def _compact(
+        self,
+        user_id: int,
+        before: float,
+        resolution: int,
+        tz_offset: int
+    ) -> int:
+        """Сжать чанки пользователя (см. `compact()`), без блокировки."""
+
+        n_records = 0
+        tail_chunk_no, _ = self._get_tail(user_id)
+        tz_seconds = tz_offset * const.SECONDS_IN_HOUR
+
+        for chunk_path in self._get_chunk_paths(user_id):
+            records = array(RECORD_TYPECODE, chunk_path.read_bytes())
+
+            # Чанки упорядочены по времени: следующие еще новее
+            if not records or records[-RECORD_LEN] >= before:
+                break
+
+            counts = Counter(zip(
+                (
+                    ts - (ts + tz_seconds) % resolution
+                    for ts in records[::RECORD_LEN]
+                ),
+                records[1::RECORD_LEN]
+            ))
+            rollup = array(RECORD_TYPECODE)
+            for (start, kind), count in sorted(counts.items()):
+                rollup.extend((start, kind, count))
+
+            with (
+                chunk_path.parent
+                / f'{ROLLUP_PREFIX}{resolution}{CHUNK_SUFFIX}'
+            ).open('ab') as f:
+                rollup.tofile(f)
+
+            chunk_path.unlink()
+            n_records += len(records) // RECORD_LEN
+
+            # Сжат текущий (последний) чанк - новые записи пишем в следующий
+            if int(chunk_path.stem) == tail_chunk_no:
+                self._tails[user_id] = (tail_chunk_no + 1, 0)
+
+        return n_records
+
+    @staticmethod
+    def _map_file(path: Path) -> memoryview | None:
+        """Отобразить файл истории в память (mmap), плоский `memoryview`
+        uint32 значений, `None` - файл удален.
+
+        NB: mmap живет, пока на него ссылается `memoryview` (в том числе
+        созданные из него массивы numpy), и закрывается при сборке мусора.
+        """
+
+        # NB: файл мог быть сжат и удален в другом потоке (`compact()`)
+        try:
+            file = path.open('rb')
+        except FileNotFoundError:
+            return None
+
+        with file:
+            try:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Пустой файл нельзя отобразить в память
+                data = file.read()
+
+        return memoryview(data).cast(RECORD_TYPECODE)
+
+    def _get_chunk_paths(self, user_id: int) -> list[Path]:
+        """Получить отсортированный список файлов-чанков пользователя."""
+
+        if not (user_path := self.path / str(user_id)).is_dir():
+            return []
+
+        return sorted(
+            chunk_path
+            for chunk_path in user_path.glob(f'*{CHUNK_SUFFIX}')
+            if not chunk_path.name.startswith(ROLLUP_PREFIX)
+        )
+
+    def _get_tail(self, user_id: int) -> tuple[int, int]:
+        """Получить номер последнего чанка и кол-во записей в нем."""
+
+        if (tail := self._tails.get(user_id)) is None:
+            if chunk_paths := self._get_chunk_paths(user_id):
+                tail = (
+                    int(chunk_paths[-1].stem),
+                    chunk_paths[-1].stat().st_size
+                    // (RECORD_LEN * array(RECORD_TYPECODE).itemsize)
+                )
+            else:
+                tail = (0, 0)
+
+        return tail
+
+    def _write_records(self, user_id: int, buffer: array):
+        """Дописать записи в чанки пользователя."""
+
+        (user_path := self.path / str(user_id)).mkdir(
+            parents=True, exist_ok=True
+        )
+        chunk_no, n_records = self._get_tail(user_id)
+        offset = 0
+
+        while offset < len(buffer):
+            if n_records >= self._chunk_size:
+                chunk_no, n_records = chunk_no + 1, 0
+
+            n_write = min(
+                self._chunk_size - n_records,
+                (len(buffer) - offset) // RECORD_LEN
+            )
+
+            with (user_path / f'{chunk_no:06d}{CHUNK_SUFFIX}').open('ab') as f:
+                buffer[offset:offset + n_write * RECORD_LEN].tofile(f)
+
+            offset += n_write * RECORD_LEN
+            n_records += n_write
+
+        self._tails[user_id] = (chunk_no, n_records)
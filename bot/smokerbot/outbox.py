@@ -0,0 +1,275 @@
+import json
+import os
+from dataclasses import dataclass
+from itertools import count
+from pathlib import Path
+
+from . import const
+from .clock import Clock
+
+# Операции журнала: добавление, неудачная попытка, удаление (доставлено или
+# отброшено)
+OUTBOX_OP_ADD = 'add'
+OUTBOX_OP_FAIL = 'fail'
+OUTBOX_OP_DONE = 'done'
+
+
+@dataclass
+class OutboxEntry:
+    id: int
+    user_id: int
+    text: str
+    created_at: float           # POSIX время добавления
+    attempts: int = 0           # кол-во неудачных попыток отправки
+    next_try_at: float = 0.     # время следующей попытки, POSIX
+
+
+class Outbox:
+    """Персистентная очередь исходящих уведомлений.
+
+    Уведомление добавляется (`add()`) до отправки и удаляется (`done()`)
+    после доставки, неудачная попытка отмечается `fail()`. Операции
+    записываются в append-only журнал JSONL (`path`), строки накапливаются
+    в памяти и сбрасываются на диск с `fsync` методом `flush()` (пакетно).
+    Недоставленные уведомления восстанавливаются из журнала методом `load()`
+    (при старте), журнал при этом перезаписывается только с ними.
+
+    Политика повторов: после `n`-й неудачной попытки следующая - через
+    `retry_delay * 2 ** (n - 1)` сек, после `max_attempts` попыток или по
+    истечении `max_age` сек с момента добавления уведомление отбрасывается.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        clock: Clock | None = None,
+        max_attempts: int = const.OUTBOX_MAX_ATTEMPTS,
+        retry_delay: float = const.OUTBOX_RETRY_DELAY,
+        max_age: float = const.OUTBOX_MAX_AGE
+    ):
+        self.path = path
+        self._clock = clock or Clock()
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+        self._max_age = max_age
+
+        # Недоставленные уведомления {id: OutboxEntry} и id отправляемых
+        self._pending: dict[int, OutboxEntry] = {}
+        self._in_flight: set[int] = set()
+        self._ids = count(1)
+
+        # Несохраненные строки журнала
+        self._buffer: list[str] = []
+
+        self.n_delivered = 0
+        self.n_dropped = 0
+
+    @property
+    def n_pending(self) -> int:
+        """Кол-во недоставленных уведомлений."""
+
+        return len(self._pending)
+
+    def load(self) -> int:
+        """Восстановить недоставленные уведомления из журнала.
+
+        Журнал перезаписывается только с недоставленными уведомлениями.
+        Поврежденные строки (например, незавершенная запись при аварийной
+        остановке) пропускаются.
+
+        Возвращает кол-во восстановленных уведомлений.
+        """
+
+        self._pending.clear()
+        max_id = 0
+
+        if self.path.is_file():
+            with self.path.open('r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                        op, entry_id = record['op'], record['id']
+                    except (ValueError, KeyError, TypeError):
+                        continue
+
+                    max_id = max(max_id, entry_id)
+
+                    if op == OUTBOX_OP_ADD:
+                        self._pending[entry_id] = OutboxEntry(
+                            id=entry_id,
+                            user_id=record['user_id'],
+                            text=record['text'],
+                            created_at=record['created_at'],
+                            attempts=record.get('attempts', 0)
+                        )
+                    elif entry := self._pending.get(entry_id):
+                        if op == OUTBOX_OP_FAIL:
+                            entry.attempts += 1
+                        else:
+                            del self._pending[entry_id]
+
+        # Попытки исчерпаны (остановка до удаления из журнала)
+        for entry in list(self._pending.values()):
+            if entry.attempts >= self._max_attempts:
+                del self._pending[entry.id]
+                self.n_dropped += 1
+
+        self._ids = count(max_id + 1)
+        self.compact()
+
+        return len(self._pending)
+
+    def add(self, user_id: int, text: str) -> int:
+        """Добавить уведомление, отправляемое вызывающим кодом.
+
+        Возвращает id уведомления.
+        """
+
+        entry = OutboxEntry(
+            id=next(self._ids),
+            user_id=user_id,
+            text=text,
+            created_at=self._clock.time()
+        )
+        self._pending[entry.id] = entry
+        self._in_flight.add(entry.id)
+        self._write(
+            op=OUTBOX_OP_ADD,
+            id=entry.id,
+            user_id=user_id,
+            text=text,
+            created_at=entry.created_at
+        )
+
+        return entry.id
+
+    def done(self, entry_id: int, delivered: bool = True):
+        """Удалить уведомление: доставлено или отброшено."""
+
+        self._in_flight.discard(entry_id)
+
+        if self._pending.pop(entry_id, None):
+            self._write(op=OUTBOX_OP_DONE, id=entry_id)
+            if delivered:
+                self.n_delivered += 1
+            else:
+                self.n_dropped += 1
+
+    def fail(self, entry_id: int) -> bool:
+        """Отметить неудачную попытку отправки.
+
+        Возвращает `False`, если попытки исчерпаны и уведомление отброшено.
+        """
+
+        self._in_flight.discard(entry_id)
+
+        if not (entry := self._pending.get(entry_id)):
+            return False
+
+        entry.attempts += 1
+        if entry.attempts >= self._max_attempts:
+            self.done(entry_id, delivered=False)
+            return False
+
+        entry.next_try_at = (
+            self._clock.time()
+            + self._retry_delay * 2 ** (entry.attempts - 1)
+        )
+        self._write(op=OUTBOX_OP_FAIL, id=entry_id)
+
+        return True
+
+    def get_next_try_at(self) -> float | None:
+        """Время ближайшей повторной отправки, `None` - повторов нет."""
+
+        return min(
+            (
+                entry.next_try_at for entry in self._pending.values()
+                if entry.id not in self._in_flight
+            ),
+            default=None
+        )
+
+    def get_due(self) -> list[OutboxEntry]:
+        """Получить уведомления, ожидающие повторной отправки.
+
+        Полученные уведомления отмечаются как отправляемые (до `done()` /
+        `fail()`), устаревшие - отбрасываются.
+        """
+
+        time_now = self._clock.time()
+        due = []
+
+        for entry in list(self._pending.values()):
+            if entry.id in self._in_flight or entry.next_try_at > time_now:
+                continue
+
+            if time_now - entry.created_at > self._max_age:
+                self.done(entry.id, delivered=False)
+                continue
+
+            self._in_flight.add(entry.id)
+            due.append(entry)
+
+        return due
+
+    def flush(self) -> int:
+        """Сбросить накопленные строки журнала на диск (`fsync`).
+
+        Возвращает кол-во записанных строк.
+        """
+
+        if not (n_lines := len(self._buffer)):
+            return 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open('a', encoding='utf-8') as file:
+            file.write(''.join(self._buffer))
+            file.flush()
+            os.fsync(file.fileno())
+
+        self._buffer.clear()
+
+        return n_lines
+
+    def compact(self):
+        """Перезаписать журнал только с недоставленными уведомлениями."""
+
+        self._buffer.clear()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # NB: запись во временный файл и замена - журнал не теряется при
+        # аварийной остановке во время перезаписи
+        tmp_path = self.path.with_suffix('.tmp')
+        with tmp_path.open('w', encoding='utf-8') as file:
+            for entry in self._pending.values():
+                file.write(
+                    self._dumps(
+                        op=OUTBOX_OP_ADD,
+                        id=entry.id,
+                        user_id=entry.user_id,
+                        text=entry.text,
+                        created_at=entry.created_at,
+                        attempts=entry.attempts
+                    )
+                )
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(tmp_path, self.path)
+
+    def _write(self, **record):
+        """Добавить строку журнала в буфер."""
+
+        self._buffer.append(self._dumps(**record))
+
+        if len(self._buffer) >= const.OUTBOX_SYNC_EVERY:
+            self.flush()
+
+    @staticmethod
+    def _dumps(**record) -> str:
+        """Строка журнала JSONL."""
+
+        return json.dumps(
+            record, ensure_ascii=False, separators=(',', ':')
+        ) + '\n'
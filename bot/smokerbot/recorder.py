@@ -0,0 +1,128 @@
+import hashlib
+import json
+import secrets
+from collections.abc import Iterator
+from pathlib import Path
+from time import time
+
+from telethon import events
+
+from . import helpers
+
+# Типы событий в записи
+RECORD_KIND_MESSAGE = 'm'
+RECORD_KIND_CALLBACK = 'c'
+
+# Длина хэша отправителя, hex
+RECORD_SENDER_HASH_LEN = 12
+
+# Текст сообщений, не являющихся командами, не сохраняется
+RECORD_TEXT_PLACEHOLDER = '<text>'
+
+# Аргументы команд со свободным текстом (re-группы) не сохраняются
+RECORD_FREE_TEXT_GROUPS = ('text',)
+RECORD_REDACTED_PLACEHOLDER = '<redacted>'
+
+# Кол-во записей между сбросом буфера файла на диск
+RECORD_FLUSH_EVERY = 100
+
+
+class UpdateRecorder:
+    """Запись входящих обновлений в компактный JSONL для последующего replay.
+
+    Каждое обновление - строка вида:
+        `{"t": 1700000012.345, "k": "m", "u": "3fa1...", "x": "/smoke"}`
+    где `t` - POSIX время получения, сек (файл дописывается, поэтому время
+    не убывает и между перезапусками бота), `k` - тип события (сообщение
+    или callback), `u` - хэш отправителя (с солью, `user_id` не
+    сохраняется), `x` - команда или данные callback.
+
+    Для команд бота сохраняются имя и аргументы, свободный текст аргументов
+    (например, `/broadcast <redacted>`) заменяется на
+    `RECORD_REDACTED_PLACEHOLDER`, текст сообщений, не являющихся
+    командами, - на `RECORD_TEXT_PLACEHOLDER`.
+    """
+
+    def __init__(self, path: Path, salt: str | None = None):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = path.open('a', encoding='utf-8')
+        self._salt = (salt or secrets.token_hex(16)).encode('utf-8')
+        self._n_records = 0
+
+    async def on_event(
+        self,
+        event: events.NewMessage.Event | events.CallbackQuery.Event
+    ):
+        """Обработчик событий telethon: записать событие."""
+
+        self.record(event)
+
+    def record(
+        self,
+        event: events.NewMessage.Event | events.CallbackQuery.Event
+    ):
+        """Записать событие."""
+
+        if isinstance(event, events.CallbackQuery.Event):
+            kind = RECORD_KIND_CALLBACK
+            text = event.data.decode('utf-8', errors='replace')
+        else:
+            kind = RECORD_KIND_MESSAGE
+            text = self._get_command_string(event.message.message or '')
+
+        self._file.write(
+            json.dumps(
+                {
+                    't': round(time(), 3),
+                    'k': kind,
+                    'u': self._get_sender_hash(event.sender_id),
+                    'x': text,
+                },
+                ensure_ascii=False,
+                separators=(',', ':')
+            ) + '\n'
+        )
+
+        self._n_records += 1
+        if not self._n_records % RECORD_FLUSH_EVERY:
+            self._file.flush()
+
+    def close(self):
+        """Сбросить буфер и закрыть файл записи."""
+
+        self._file.close()
+
+    @staticmethod
+    def _get_command_string(text: str) -> str:
+        """Команда с аргументами без свободного текста, либо заглушка."""
+
+        if not (command := helpers.get_command_from_string(text)):
+            return RECORD_TEXT_PLACEHOLDER
+
+        return ' '.join(
+            [f'/{command["name"]}']
+            + [
+                RECORD_REDACTED_PLACEHOLDER if group in RECORD_FREE_TEXT_GROUPS
+                else str(value)
+                for group, value in command.items()
+                if group != 'name' and value is not None
+            ]
+        )
+
+    def _get_sender_hash(self, sender_id: int) -> str:
+        """Хэш отправителя с солью."""
+
+        return hashlib.blake2b(
+            str(sender_id).encode('utf-8'),
+            digest_size=RECORD_SENDER_HASH_LEN // 2,
+            key=self._salt[:64]
+        ).hexdigest()
+
+
+def read_recording(path: Path) -> Iterator[dict]:
+    """Итератор по записям файла, созданного `UpdateRecorder`."""
+
+    with path.open('r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
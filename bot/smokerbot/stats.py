@@ -0,0 +1,196 @@
+import math
+from collections.abc import Iterable
+
+import numpy as np
+
+from . import const
+
+
+def get_records_array(chunks: Iterable[memoryview]) -> np.ndarray:
+    """Собрать записи истории в массив формы `(n, 2)`: `[timestamp, kind]`.
+
+    Чанки (mmap) не копируются по отдельности, копия создается только при
+    объединении.
+    """
+
+    arrays = [np.frombuffer(chunk, dtype=np.uint32) for chunk in chunks]
+
+    if not arrays:
+        return np.empty((0, 2), dtype=np.uint32)
+
+    return np.concatenate(arrays).reshape(-1, 2)
+
+
+def get_rollups_array(
+    rollups: Iterable[tuple[int, memoryview]]
+) -> np.ndarray:
+    """Собрать агрегаты истории (всех разрешений) в массив формы `(n, 3)`:
+    `[start, kind, count]`.
+    """
+
+    arrays = [
+        np.frombuffer(records, dtype=np.uint32) for _, records in rollups
+    ]
+
+    if not arrays:
+        return np.empty((0, 3), dtype=np.uint32)
+
+    return np.concatenate(arrays).reshape(-1, 3)
+
+
+def get_stats(
+    records: np.ndarray,
+    interval: int,
+    tz_offset: int,
+    time_now: float,
+    n_days: int = const.STATS_DAYS,
+    rollups: np.ndarray | None = None
+) -> dict:
+    """Вычислить статистику по истории событий пользователя.
+
+    Аргументы:
+        - `records` - массив записей истории `(n, 2)`
+        - `interval` - установленный интервал между сигаретами, мин
+        - `tz_offset` - смещение часового пояса, ч
+        - `time_now` - текущее время, POSIX
+        - `n_days` - глубина статистики по дням
+        - `rollups` - массив агрегатов сжатой истории `(n, 3)`, учитываются
+        только в кол-вах по дням (интервалы по агрегатам не восстановить)
+
+    Возвращает словарь со значениями:
+        - `total` - всего выкурено
+        - `day_counts` - кол-во сигарет по дням, начиная с сегодняшнего
+        (массив длины `n_days`)
+        - `avg_per_day`, `avg_per_day_prev` - среднее кол-во в день за
+        последние и предыдущие `n_days` дней
+        - `n_intervals`, `mean_interval`, `median_interval` - интервалы
+        между сигаретами (в пределах одного запуска таймера), сек
+        - `share_ok` - доля интервалов не короче установленного
+        - `histogram` - кол-во интервалов в корзинах `const.STATS_HIST_BINS`
+        (в долях установленного интервала)
+        - `streak`, `best_streak` - текущая и лучшая серия дней без
+        интервалов короче установленного
+
+    Если выкуренных сигарет в истории нет (например, история сжата), кол-ва
+    нулевые, значения интервалов - `None`.
+    """
+
+    timestamps = records[:, 0].astype(np.int64)
+    kinds = records[:, 1]
+
+    # Номер запуска таймера: увеличивается на каждом /run и /stop
+    run_no = np.cumsum(
+        (kinds == const.HISTORY_EVENT_RUN)
+        | (kinds == const.HISTORY_EVENT_STOP)
+    )
+
+    is_smoke = kinds == const.HISTORY_EVENT_SMOKE
+    smoke_ts = timestamps[is_smoke]
+    smoke_run_no = run_no[is_smoke]
+
+    # Локальный день (номер дня от эпохи с учетом часового пояса)
+    tz_seconds = tz_offset * const.SECONDS_IN_HOUR
+    smoke_day = (smoke_ts + tz_seconds) // const.SECONDS_IN_DAY
+    today = int(time_now + tz_seconds) // const.SECONDS_IN_DAY
+
+    # Кол-во сигарет по дням: [сегодня, вчера, ...] за 2 * n_days
+    days_ago = today - smoke_day
+    day_counts = np.bincount(
+        days_ago[(days_ago >= 0) & (days_ago < 2 * n_days)],
+        minlength=2 * n_days
+    )
+
+    # Сжатая история: кол-ва из агрегатов (периоды - по местному времени)
+    if rollups is not None and rollups.size:
+        smoke_rollups = rollups[rollups[:, 1] == const.HISTORY_EVENT_SMOKE]
+        rollup_days_ago = today - (
+            smoke_rollups[:, 0].astype(np.int64) + tz_seconds
+        ) // const.SECONDS_IN_DAY
+        in_range = (rollup_days_ago >= 0) & (rollup_days_ago < 2 * n_days)
+        day_counts += np.bincount(
+            rollup_days_ago[in_range],
+            weights=smoke_rollups[in_range, 2],
+            minlength=2 * n_days
+        ).astype(day_counts.dtype)
+
+    # Интервалы между сигаретами в пределах одного запуска
+    same_run = np.diff(smoke_run_no) == 0
+    intervals = np.diff(smoke_ts)[same_run]
+    interval_day = smoke_day[1:][same_run]
+    interval_seconds = interval * const.SECONDS_IN_MINUTE
+    is_short = intervals < interval_seconds
+
+    histogram, _ = np.histogram(
+        intervals / interval_seconds, bins=const.STATS_HIST_BINS
+    )
+
+    # Серии дней без коротких интервалов: от первого дня до сегодняшнего
+    # NB: записи "из будущего" (смена часового пояса, часы сервера) не
+    # учитываются; если прошедших дней нет - серий нет (пустой массив)
+    past_days = smoke_day[smoke_day <= today]
+    first_day = int(past_days.min()) if past_days.size else today + 1
+    is_good_day = np.ones(max(today - first_day + 1, 0), dtype=np.int8)
+    is_good_day[
+        interval_day[is_short & (interval_day <= today)] - first_day
+    ] = 0
+
+    # Границы серий: индексы переходов 0 -> 1 и 1 -> 0
+    edges = np.diff(np.concatenate(([0], is_good_day, [0])))
+    streak_lengths = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+
+    return {
+        'total': int(smoke_ts.size),
+        'day_counts': day_counts[:n_days],
+        'avg_per_day': float(day_counts[:n_days].mean()),
+        'avg_per_day_prev': float(day_counts[n_days:].mean()),
+        'n_intervals': int(intervals.size),
+        'mean_interval': float(intervals.mean()) if intervals.size else None,
+        'median_interval': (
+            float(np.median(intervals)) if intervals.size else None
+        ),
+        'share_ok': (
+            float(1 - is_short.mean()) if intervals.size else None
+        ),
+        'histogram': histogram,
+        'streak': int(
+            streak_lengths[-1] if streak_lengths.size and is_good_day[-1]
+            else 0
+        ),
+        'best_streak': int(streak_lengths.max(initial=0)),
+    }
+
+
+def get_rollup_stats(userdata, time_now: float) -> dict:
+    """Вычислить статистику по агрегатам `stat_*` объекта `UserData`, O(1).
+
+    Возвращает словарь со значениями:
+        - `total`, `today_count`, `week_count` - кол-во сигарет всего,
+        за текущие (локальные) день и неделю
+        - `mean_interval`, `std_interval`, `min_interval`, `max_interval` -
+        интервалы между сигаретами, сек (`None`, если интервалов нет)
+    """
+
+    day = int(
+        time_now + userdata.tz_offset * const.SECONDS_IN_HOUR
+    ) // const.SECONDS_IN_DAY
+
+    if n := userdata.stat_n_intervals:
+        mean = userdata.stat_interval_sum / n
+        std = math.sqrt(max(userdata.stat_interval_sq_sum / n - mean ** 2, 0))
+    else:
+        mean = std = None
+
+    return {
+        'total': userdata.stat_total,
+        'today_count': (
+            userdata.stat_day_count if userdata.stat_day == day else 0
+        ),
+        'week_count': (
+            userdata.stat_week_count if userdata.stat_week == (day + 3) // 7
+            else 0
+        ),
+        'mean_interval': mean,
+        'std_interval': std,
+        'min_interval': userdata.stat_interval_min,
+        'max_interval': userdata.stat_interval_max,
+    }
@@ -0,0 +1,191 @@
+import asyncio
+import functools
+import json
+import random
+from collections.abc import Callable, Iterator
+from contextvars import ContextVar
+from itertools import count
+from pathlib import Path
+from time import perf_counter, time
+
+# Типы спанов: метод хендлера, вызов Telegram API (лист)
+SPAN_KIND_METHOD = 'method'
+SPAN_KIND_CLIENT = 'client'
+
+# Результат спана без исключения, при отмене; иначе - имя класса исключения
+SPAN_OUTCOME_OK = 'ok'
+SPAN_OUTCOME_CANCELLED = 'cancelled'
+
+# Кол-во спанов между сбросом буфера файла на диск
+TRACE_FLUSH_EVERY = 100
+
+# NB: контекстные переменные создаются на уровне модуля (см. context.py)
+# Текущая трасса (trace_id, имя задачи), None - задача не трассируется
+trace: ContextVar[tuple[str, str] | None] = ContextVar('trace', default=None)
+# id текущего (родительского) спана
+span_id: ContextVar[int | None] = ContextVar('span_id', default=None)
+
+_span_ids = count(1)
+_sample_rate = 0.
+_exporter: 'SpanExporter | None' = None
+
+
+class SpanExporter:
+    """Экспорт завершенных спанов в JSONL.
+
+    Каждый спан - строка вида:
+        `{"trace": "9c1e...", "task": "new message", "span": 12,
+        "parent": 11, "name": "_send_message", "kind": "client",
+        "start": 1700000000.123, "ms": 41.2, "outcome": "ok"}`
+    где `start` - POSIX время начала, `ms` - длительность, `outcome` -
+    результат (`SPAN_OUTCOME_*` или имя класса исключения). Корневой спан
+    трассы (`parent` - null) - метод, создавший задачу (`new_context`).
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = path.open('a', encoding='utf-8')
+        self._n_spans = 0
+
+    def export(self, span: dict):
+        """Записать завершенный спан."""
+
+        self._file.write(json.dumps(span, separators=(',', ':')) + '\n')
+
+        self._n_spans += 1
+        if not self._n_spans % TRACE_FLUSH_EVERY:
+            self._file.flush()
+
+    def close(self):
+        """Сбросить буфер и закрыть файл."""
+
+        self._file.close()
+
+
+def configure(sample_rate: float, path: Path):
+    """Включить трассировку: доля трассируемых задач и файл экспорта."""
+
+    global _sample_rate, _exporter
+
+    shutdown()
+    _sample_rate = sample_rate
+    _exporter = SpanExporter(path) if sample_rate > 0 else None
+
+
+def shutdown():
+    """Выключить трассировку, закрыть файл экспорта."""
+
+    global _sample_rate, _exporter
+
+    if _exporter:
+        _exporter.close()
+    _sample_rate, _exporter = 0., None
+
+
+def start_trace(task_name: str):
+    """Начать трассу задачи в текущем (новом) контексте, если выбрана.
+
+    Задача выбирается с вероятностью `sample_rate`, вызывается при создании
+    контекста задачи (`new_context`).
+    """
+
+    if _sample_rate and random.random() < _sample_rate:
+        trace.set((f'{random.getrandbits(64):016x}', task_name))
+
+
+def client_call(method: Callable) -> Callable:
+    """Отметить метод как вызов Telegram API (листовой спан)."""
+
+    method.trace_kind = SPAN_KIND_CLIENT
+
+    return method
+
+
+def traced(method: Callable) -> Callable:
+    """Обернуть метод (sync/async) записью спана.
+
+    Используется `manage_context`, обертка вызывается только в
+    трассируемых задачах.
+    """
+
+    kind = getattr(method, 'trace_kind', SPAN_KIND_METHOD)
+
+    if not asyncio.iscoroutinefunction(method):
+
+        @functools.wraps(method)
+        def sync_traced_wrapper(*args, **kwargs):
+
+            span = _enter_span()
+            outcome = SPAN_OUTCOME_OK
+            try:
+                return method(*args, **kwargs)
+            except BaseException as exc:
+                outcome = exc.__class__.__name__
+                raise
+            finally:
+                _exit_span(span, method.__name__, kind, outcome)
+
+        return sync_traced_wrapper
+
+    @functools.wraps(method)
+    async def async_traced_wrapper(*args, **kwargs):
+
+        span = _enter_span()
+        outcome = SPAN_OUTCOME_OK
+        try:
+            return await method(*args, **kwargs)
+        except asyncio.CancelledError:
+            outcome = SPAN_OUTCOME_CANCELLED
+            raise
+        except BaseException as exc:
+            outcome = exc.__class__.__name__
+            raise
+        finally:
+            _exit_span(span, method.__name__, kind, outcome)
+
+    return async_traced_wrapper
+
+
+def read_spans(path: Path) -> Iterator[dict]:
+    """Итератор по спанам файла, созданного `SpanExporter`."""
+
+    with path.open('r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _enter_span() -> tuple:
+    """Начать спан: (id, id родителя, токен, время начала, perf_counter)."""
+
+    new_span_id = next(_span_ids)
+
+    return (
+        new_span_id,
+        span_id.get(),
+        span_id.set(new_span_id),
+        time(),
+        perf_counter()
+    )
+
+
+def _exit_span(span: tuple, name: str, kind: str, outcome: str):
+    """Завершить спан и передать его экспортеру."""
+
+    new_span_id, parent_id, token, started_at, perf_started_at = span
+    span_id.reset(token)
+
+    if _exporter and (current_trace := trace.get()):
+        _exporter.export(
+            {
+                'trace': current_trace[0],
+                'task': current_trace[1],
+                'span': new_span_id,
+                'parent': parent_id,
+                'name': name,
+                'kind': kind,
+                'start': round(started_at, 6),
+                'ms': round((perf_counter() - perf_started_at) * 1000, 3),
+                'outcome': outcome,
+            }
+        )
@@ -1,7 +1,5 @@
 from dataclasses import asdict, dataclass
 
-import yaml
-
 from . import const, context
 from .basehandler import BaseHandler
 from .exceptions import ContextValuetError
@@ -30,6 +28,19 @@ class UserData:
     timer_start: float | None   # timer started at, POSIX
     timer_end: float | None     # timer end time, POSIX
 
+    # Running aggregates (rollups), updated on each event
+    stat_total: int                     # sigs smoked, all time
+    stat_day: int | None                # local day No. of stat_day_count
+    stat_day_count: int                 # sigs smoked during stat_day
+    stat_week: int | None               # local week No. of stat_week_count
+    stat_week_count: int                # sigs smoked during stat_week
+    stat_last_smoke: float | None       # last sig in current run, POSIX
+    stat_n_intervals: int               # intervals within runs: count,
+    stat_interval_sum: float            # sum, seconds
+    stat_interval_sq_sum: float         # sum of squares
+    stat_interval_min: float | None     # min, seconds
+    stat_interval_max: float | None     # max, seconds
+
 
 class UserdataMixin:
     """Методы работы с пользовательскими данными."""
@@ -46,10 +57,15 @@ class UserdataMixin:
     def _load_userdata(self):
         """Загрузка пользовательских данных."""
 
+        # NB: отложенный импорт - при старте выполняется в отдельном потоке
+        import yaml
+
         if (filename := (self.data_path / 'userdata.yaml')).is_file():
             with filename.open('r') as f:
+                # NB: значения по умолчанию для полей, отсутствующих в файле
                 self._users = {
-                    k: UserData(**v) for k, v in yaml.safe_load(f).items()
+                    k: UserData(**(const.USER_DATA_DEFAULT | v))
+                    for k, v in yaml.safe_load(f).items()
                 }
 
             self.logger.info(f'{context.get_task_prefix()} User data loaded')
@@ -58,6 +74,9 @@ class UserdataMixin:
     def _save_userdata(self):
         """Сохранение пользовательских данных."""
 
+        # NB: отложенный импорт - зависимость не нужна при импорте модуля
+        import yaml
+
         with open(self.data_path / 'userdata.yaml', 'w') as file:
             yaml.safe_dump(
                 {k: asdict(v) for k, v in self._users.items()},
@@ -68,11 +87,40 @@ class UserdataMixin:
         self.logger.info(f'{context.get_task_prefix()} User data persisted')
 
     @manage_context
+    def _save_history(self):
+        """Сохранение накопленной истории событий пользователей."""
+
+        n_records = self._history.flush()
+
+        self.logger.info(
+            f'{context.get_task_prefix()} History persisted, '
+            f'{n_records} new records'
+        )
+
     def _get_or_create_userdata(self, user_id: int | None = None) -> UserData:
         """Получить или создать дефолтный объект данных пользователя.
 
         Если аргумент `user_id` не был передан, используется `sender_id` из
         текущего контекста.
+
+        Данные отправителя запоминаются в контексте запроса
+        (`context.userdata`) при первом обращении, повторные обращения при
+        обработке того же события возвращают их без поиска и `manage_context`.
+        """
+
+        if (
+            (memo := context.userdata.get())
+            and memo[0] == (user_id or context.sender_id.get())
+        ):
+            return memo[1]
+
+        return self._resolve_userdata(user_id)
+
+    @manage_context
+    def _resolve_userdata(self, user_id: int | None = None) -> UserData:
+        """Найти или создать данные пользователя.
+
+        Данные отправителя (`sender_id`) запоминаются в текущем контексте.
         """
 
         if not (user_id or (user_id := context.sender_id.get())):
@@ -81,8 +129,26 @@ class UserdataMixin:
         if not (userdata := self._users.get(user_id)):
             self._users[user_id] = (userdata := self._get_default_userdata())
 
+        # NB: memo хранит user_id, т.к. sender_id может быть переопределен
+        # в рамках задачи (например, рассылка администратора)
+        if user_id == context.sender_id.get():
+            context.userdata.set((user_id, userdata))
+
         return userdata
 
+    @manage_context
+    def _update_activity(self, user_id: int | None = None):
+        """Обновить индекс активности по текущим данным пользователя.
+
+        Если аргумент `user_id` не был передан, используется `sender_id` из
+        текущего контекста.
+        """
+
+        if not (user_id or (user_id := context.sender_id.get())):
+            raise ContextValuetError('no \'sender_id\' set in context')
+
+        self._activity.update(user_id, self._get_or_create_userdata(user_id))
+
     @manage_context
     def _get_settings_string(self) -> str:
         """Сформировать строку сообщения с настройками пользователя."""
@@ -98,3 +164,68 @@ class UserdataMixin:
             initial_sig=userdata.initial_sig,
             tz_offset=userdata.tz_offset
         )
+
+    @manage_context
+    def _record_event(self, kind: int, user_id: int | None = None):
+        """Добавить событие `kind` в историю пользователя.
+
+        Если аргумент `user_id` не был передан, используется `sender_id` из
+        текущего контекста.
+        """
+
+        if not (user_id or (user_id := context.sender_id.get())):
+            raise ContextValuetError('no \'sender_id\' set in context')
+
+        time_now = self._clock.time()
+
+        self._history.append(user_id, kind, time_now)
+        self._update_rollups(
+            self._get_or_create_userdata(user_id), kind, time_now
+        )
+
+        # Статистика пользователя устарела
+        self._stats_cache.pop(user_id, None)
+
+    @manage_context
+    def _update_rollups(self, userdata: UserData, kind: int, time_now: float):
+        """Обновить агрегаты `stat_*` пользователя событием `kind`, O(1)."""
+
+        # Интервалы считаются только в пределах одного запуска таймера
+        if kind in (const.HISTORY_EVENT_RUN, const.HISTORY_EVENT_STOP):
+            userdata.stat_last_smoke = None
+            return
+
+        if kind != const.HISTORY_EVENT_SMOKE:
+            return
+
+        # Локальные номера дня и недели (неделя начинается с понедельника,
+        # 01.01.1970 - четверг)
+        day = int(
+            time_now + userdata.tz_offset * const.SECONDS_IN_HOUR
+        ) // const.SECONDS_IN_DAY
+        week = (day + 3) // 7
+
+        if userdata.stat_day != day:
+            userdata.stat_day, userdata.stat_day_count = day, 0
+        if userdata.stat_week != week:
+            userdata.stat_week, userdata.stat_week_count = week, 0
+
+        userdata.stat_total += 1
+        userdata.stat_day_count += 1
+        userdata.stat_week_count += 1
+
+        if userdata.stat_last_smoke is not None:
+            interval = time_now - userdata.stat_last_smoke
+            userdata.stat_n_intervals += 1
+            userdata.stat_interval_sum += interval
+            userdata.stat_interval_sq_sum += interval ** 2
+            userdata.stat_interval_min = (
+                interval if userdata.stat_interval_min is None
+                else min(interval, userdata.stat_interval_min)
+            )
+            userdata.stat_interval_max = (
+                interval if userdata.stat_interval_max is None
+                else max(interval, userdata.stat_interval_max)
+            )
+
+        userdata.stat_last_smoke = time_now